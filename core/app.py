@@ -1,9 +1,17 @@
 from PyQt5.QtWidgets import QMainWindow, QFileDialog, QMessageBox, QMenuBar, QMenu, QAction
-from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QIcon
 from core.mask import Mask, MaskType
-from core.media import Media
+from core.media import Media, PendingMedia
+from core.frame_cache import frame_cache
+from core.media_loader import MediaLoader
+from core.resource_manager import MediaResourceManager
+from core.proxy import proxy_cache
+from core.probe import probe_cache
+from core.image_cache import image_cache
 from core.renderer import Renderer
+from core.render_thread import RenderThread
+from core.scheduler import FrameScheduler
 from core.project import ProjectSerializer
 from ui.control_window import ControlWindow
 from ui.projection_window import ProjectionWindow
@@ -21,6 +29,10 @@ def get_resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 class ProjectionMapper(QMainWindow):
+    # Emitted from the proxy transcoding thread with the source video's path
+    proxy_ready = pyqtSignal(str)
+    frame_published = pyqtSignal(int)  # Emitted from the render thread
+
     def __init__(self):
         super().__init__()
 
@@ -28,13 +40,29 @@ class ProjectionMapper(QMainWindow):
         self.projection_height = 1080
 
         self.masks = []
-        self.renderer = Renderer(self.projection_width, self.projection_height)
+        # Three output buffers: one being shown, one being rendered, one spare
+        self.renderer = Renderer(self.projection_width, self.projection_height, buffer_count=3)
+        self._scene_signature = None
         self.current_file = None  # Track current project file
 
         # Project management
         self.loaded_projects = {}  # Dictionary: file_path -> project_data
         self.current_project_path = None  # Currently active project
 
+        # Opens project media in the background
+        self.media_loader = MediaLoader(parent=self)
+        self.media_loader.progress.connect(self.on_media_load_progress)
+        self.media_loader.media_ready.connect(self.on_media_opened)
+        self.media_loader.media_failed.connect(self.on_media_failed)
+        self._media_requests = set()  # Masks whose media the user just picked, to report failures
+        # Keeps the last couple of inactive projects' media open, suspends older ones
+        self.resource_manager = MediaResourceManager(self.media_loader, self.release_media,
+                                                     max_warm_projects=2)
+
+        # Switch videos to their proxies as the transcodes finish
+        self.proxy_ready.connect(self.on_proxy_ready)
+        proxy_cache.callbacks.append(self.proxy_ready.emit)
+
         self.init_ui()
 
         # Create initial mask after UI is ready
@@ -96,6 +124,14 @@ class ProjectionMapper(QMainWindow):
         add_webcam_action.triggered.connect(self.add_webcam_to_selected_mask)
         file_menu.addAction(add_webcam_action)
 
+        add_sequence_action = QAction('Add Image Sequence to Mask...', self)
+        add_sequence_action.triggered.connect(self.add_sequence_to_selected_mask)
+        file_menu.addAction(add_sequence_action)
+
+        media_playback_action = QAction('Media Playback...', self)
+        media_playback_action.triggered.connect(self.media_playback_dialog)
+        file_menu.addAction(media_playback_action)
+
         file_menu.addSeparator()
 
         exit_action = QAction('Exit', self)
@@ -113,6 +149,34 @@ class ProjectionMapper(QMainWindow):
         fullscreen_action.triggered.connect(self.toggle_projection_fullscreen)
         view_menu.addAction(fullscreen_action)
 
+        view_menu.addSeparator()
+
+        window_resolution_action = QAction('Render at Window Resolution', self)
+        window_resolution_action.setCheckable(True)
+        window_resolution_action.setChecked(True)
+        window_resolution_action.toggled.connect(self.set_render_at_window_resolution)
+        view_menu.addAction(window_resolution_action)
+
+        proxies_action = QAction('Use Proxies for Playback', self)
+        proxies_action.setCheckable(True)
+        proxies_action.setChecked(proxy_cache.enabled)
+        proxies_action.toggled.connect(self.set_use_proxies)
+        view_menu.addAction(proxies_action)
+
+        persist_images_action = QAction('Keep Decoded Images on Disk', self)
+        persist_images_action.setCheckable(True)
+        persist_images_action.setChecked(image_cache.persist)
+        persist_images_action.toggled.connect(self.set_persist_decoded_images)
+        view_menu.addAction(persist_images_action)
+
+        render_threads_action = QAction('Render Threads...', self)
+        render_threads_action.triggered.connect(self.set_render_threads_dialog)
+        view_menu.addAction(render_threads_action)
+
+        editor_rate_action = QAction('Editor Refresh Rate...', self)
+        editor_rate_action.triggered.connect(self.set_editor_refresh_rate_dialog)
+        view_menu.addAction(editor_rate_action)
+
         # Export menu
         export_menu = menubar.addMenu('Export')
 
@@ -135,10 +199,20 @@ class ProjectionMapper(QMainWindow):
                                                    self.projection_height)
         self.projection_window.show()
 
-        # Render timer
-        self.render_timer = QTimer()
-        self.render_timer.timeout.connect(self.render_frame)
-        self.render_timer.start(33)  # ~30 FPS
+        # Rendering runs on its own thread so editor work never stalls the output;
+        # it renders one frame per scheduler tick, and the projection window
+        # repaints as soon as that frame is published rather than on the next tick
+        self.render_thread = RenderThread(self.renderer, fps=None)
+        self.frame_published.connect(self.projection_window.update_frame)
+        self.render_thread.callbacks.append(self.frame_published.emit)
+        self.render_thread.start()
+
+        # One clock drives rendering and the editor repaint
+        self.editor_frame_divisor = 1  # Repaint the editor every Nth frame
+        self.scheduler = FrameScheduler(fps=30, parent=self)
+        self.scheduler.subscribe(self.render_frame)
+        self.scheduler.subscribe(self.control_window.update_frame, self.editor_frame_divisor)
+        self.scheduler.start()
 
     def create_initial_mask(self):
         mask = Mask(MaskType.RECTANGLE, 600, 400, (200, 200))
@@ -183,15 +257,11 @@ class ProjectionMapper(QMainWindow):
             self,
             "Select Media",
             "",
-            "Media Files (*.jpg *.jpeg *.png *.bmp *.mp4 *.avi *.mov *.mkv *.webm)"
+            "Media Files (*.jpg *.jpeg *.png *.bmp *.gif *.mp4 *.avi *.mov *.mkv *.webm)"
         )
 
         if file_path:
-            try:
-                media = Media(file_path)
-                mask.media = media
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not load media: {str(e)}")
+            self.open_media(mask, file_path)
 
     def add_webcam_to_selected_mask(self):
         """Add webcam to the currently selected mask"""
@@ -201,6 +271,80 @@ class ProjectionMapper(QMainWindow):
 
         self.add_webcam_to_mask(self.control_window.selected_mask)
 
+    def add_sequence_to_selected_mask(self):
+        """Play a folder of numbered frames on the currently selected mask"""
+        mask = self.control_window.selected_mask
+        if not mask:
+            QMessageBox.warning(self, "No Mask Selected", "Please select a mask first.")
+            return
+
+        folder = QFileDialog.getExistingDirectory(self, "Select Image Sequence Folder")
+        if folder:
+            self.open_media(mask, folder)
+
+    def media_playback_dialog(self):
+        """Set the playback rate and start offset of the selected mask's media"""
+        from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QDoubleSpinBox, QPushButton, QHBoxLayout
+
+        mask = self.control_window.selected_mask
+        if not mask or not mask.media:
+            QMessageBox.warning(self, "No Media Selected", "Please select a mask with media first.")
+            return
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Media Playback")
+        layout = QVBoxLayout()
+
+        layout.addWidget(QLabel("Playback rate (1.0 = native speed):"))
+        rate_spinbox = QDoubleSpinBox()
+        rate_spinbox.setRange(0.1, 10.0)
+        rate_spinbox.setSingleStep(0.1)
+        rate_spinbox.setValue(mask.media.rate)
+        layout.addWidget(rate_spinbox)
+
+        layout.addWidget(QLabel("Start offset (seconds):"))
+        offset_spinbox = QDoubleSpinBox()
+        offset_spinbox.setRange(0.0, 86400.0)
+        offset_spinbox.setDecimals(2)
+        offset_spinbox.setValue(mask.media.start_offset)
+        layout.addWidget(offset_spinbox)
+
+        # Frame folders have no timing of their own
+        fps_spinbox = None
+        if mask.media.is_sequence and os.path.isdir(mask.media.path):
+            layout.addWidget(QLabel("Sequence frame rate (fps):"))
+            fps_spinbox = QDoubleSpinBox()
+            fps_spinbox.setRange(1.0, 240.0)
+            fps_spinbox.setDecimals(3)
+            fps_spinbox.setValue(mask.media.fps)
+            layout.addWidget(fps_spinbox)
+
+        # Buttons
+        button_layout = QHBoxLayout()
+        ok_button = QPushButton("OK")
+        ok_button.clicked.connect(dialog.accept)
+        cancel_button = QPushButton("Cancel")
+        cancel_button.clicked.connect(dialog.reject)
+        button_layout.addWidget(ok_button)
+        button_layout.addWidget(cancel_button)
+        layout.addLayout(button_layout)
+
+        dialog.setLayout(layout)
+
+        if dialog.exec_():
+            # Only this mask's clock changes; it may move to another source
+            with self.render_thread.paused():
+                media = mask.media
+                if media.ready:
+                    media.set_clock(rate_spinbox.value(), offset_spinbox.value(),
+                                    fps_spinbox.value() if fps_spinbox is not None else None)
+                else:
+                    media.rate = rate_spinbox.value()
+                    media.start_offset = offset_spinbox.value()
+                    if fps_spinbox is not None:
+                        media.set_sequence_fps(fps_spinbox.value())
+                media.restart()
+
     def add_webcam_to_mask(self, mask):
         """Add webcam as media source to a mask"""
         from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QSpinBox, QPushButton, QHBoxLayout
@@ -236,7 +380,7 @@ class ProjectionMapper(QMainWindow):
             try:
                 # Release old media if any
                 if mask.media:
-                    mask.media.release()
+                    self.release_media(mask.media)
 
                 # Create webcam media
                 media = Media(path="", is_webcam=True, webcam_index=webcam_index)
@@ -250,10 +394,11 @@ class ProjectionMapper(QMainWindow):
         if mask in self.masks:
             # Release media resources if any
             if mask.media:
-                mask.media.release()
+                self.release_media(mask.media)
 
             # Remove from masks list
             self.masks.remove(mask)
+            self._media_requests.discard(mask)
 
             # Clear selection if deleted mask was selected
             if self.control_window.selected_mask == mask:
@@ -271,37 +416,172 @@ class ProjectionMapper(QMainWindow):
             self,
             "Replace Media",
             "",
-            "Media Files (*.jpg *.jpeg *.png *.bmp *.mp4 *.avi *.mov *.mkv *.webm)"
+            "Media Files (*.jpg *.jpeg *.png *.bmp *.gif *.mp4 *.avi *.mov *.mkv *.webm)"
         )
 
         if file_path:
-            try:
-                # Release old media if any
-                if mask.media:
-                    mask.media.release()
+            self.open_media(mask, file_path)
+
+            # Reset media transform
+            mask.media_transform.reset()
+
+    def open_media(self, mask, path):
+        """Open path on the mask in the background, showing a placeholder until it's ready.
+
+        Opening can be slow (huge stills are tiled first), so it stays off the GUI thread.
+        """
+        if mask.media:
+            self.release_media(mask.media)
+        self._media_requests.add(mask)
+        self.media_loader.load(mask, PendingMedia(path))
+
+    def on_media_opened(self, mask, media):
+        self._media_requests.discard(mask)
+
+    def on_media_failed(self, mask, error):
+        """Report media the user picked that couldn't be opened"""
+        if mask in self._media_requests:
+            self._media_requests.discard(mask)
+            QMessageBox.critical(self, "Error", f"Could not load media: {error}")
+
+    def release_media(self, media):
+        """Release a media source without racing the render thread"""
+        with self.render_thread.paused():
+            media.release()
+
+    def render_frame(self, frame_index=None):
+        """Hand the current masks to the render thread if they changed, and render a frame"""
+        signature = (id(self.masks),) + tuple(
+            (id(mask), mask.version, mask.media_transform.version, id(mask.media))
+            for mask in self.masks
+        )
+        if signature != self._scene_signature:
+            self._scene_signature = signature
+            self.render_thread.submit(self.masks)
 
-                # Load new media
-                media = Media(file_path)
-                mask.media = media
+        self.render_thread.request_frame()
 
-                # Reset media transform
-                mask.media_transform.reset()
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not load media: {str(e)}")
+    def set_render_threads_dialog(self):
+        """Choose how many threads warp masks in parallel"""
+        from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QSpinBox, QPushButton, QHBoxLayout
 
-    def render_frame(self):
-        self.renderer.reset_canvas()
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Render Threads")
+        layout = QVBoxLayout()
 
-        for mask in self.masks:
-            if mask.media:
-                self.renderer.render_mask(mask)
+        label = QLabel("Number of threads used to render masks (1 = serial):")
+        layout.addWidget(label)
+
+        spinbox = QSpinBox()
+        spinbox.setMinimum(1)
+        spinbox.setMaximum(max(1, os.cpu_count() or 1))
+        spinbox.setValue(self.renderer.render_threads)
+        layout.addWidget(spinbox)
+
+        # Buttons
+        button_layout = QHBoxLayout()
+        ok_button = QPushButton("OK")
+        ok_button.clicked.connect(dialog.accept)
+        cancel_button = QPushButton("Cancel")
+        cancel_button.clicked.connect(dialog.reject)
+        button_layout.addWidget(ok_button)
+        button_layout.addWidget(cancel_button)
+        layout.addLayout(button_layout)
+
+        dialog.setLayout(layout)
+
+        if dialog.exec_():
+            # Replaces the worker pool, so it can't happen mid-frame
+            with self.render_thread.paused():
+                self.renderer.set_render_threads(spinbox.value())
+
+    def set_editor_frame_divisor(self, divisor):
+        """Repaint the editor on every Nth output frame, leaving the projection at full rate"""
+        self.editor_frame_divisor = max(1, int(divisor))
+        self.scheduler.set_divisor(self.control_window.update_frame, self.editor_frame_divisor)
+
+    def set_editor_refresh_rate_dialog(self):
+        """Choose how often the editor repaints relative to the projection"""
+        from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QSpinBox, QPushButton, QHBoxLayout
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Editor Refresh Rate")
+        layout = QVBoxLayout()
 
-        # Draw grids if enabled
-        if self.renderer.show_grid:
-            for mask in self.masks:
-                self.renderer.draw_grid(mask)
+        label = QLabel(f"Repaint the editor every N frames (the projection runs at {self.scheduler.fps:g} FPS):")
+        layout.addWidget(label)
 
-        self.projection_window.update()
+        spinbox = QSpinBox()
+        spinbox.setMinimum(1)
+        spinbox.setMaximum(10)
+        spinbox.setValue(self.editor_frame_divisor)
+        layout.addWidget(spinbox)
+
+        # Buttons
+        button_layout = QHBoxLayout()
+        ok_button = QPushButton("OK")
+        ok_button.clicked.connect(dialog.accept)
+        cancel_button = QPushButton("Cancel")
+        cancel_button.clicked.connect(dialog.reject)
+        button_layout.addWidget(ok_button)
+        button_layout.addWidget(cancel_button)
+        layout.addLayout(button_layout)
+
+        dialog.setLayout(layout)
+
+        if dialog.exec_():
+            self.set_editor_frame_divisor(spinbox.value())
+
+    def get_all_masks(self):
+        """Masks of the current project and of every other loaded project"""
+        masks = {id(mask): mask for mask in self.masks}
+        for project in self.loaded_projects.values():
+            for mask in project["masks"]:
+                masks.setdefault(id(mask), mask)
+        return list(masks.values())
+
+    def reopen_media(self, mask):
+        """Reopen a mask's video, picking up the current proxy setting"""
+        old_media = mask.media
+        try:
+            mask.media = old_media.reopen()
+        except Exception as e:
+            print(f"Warning: Could not reopen media {old_media.path}: {e}")
+            return
+        self.release_media(old_media)
+
+    def set_persist_decoded_images(self, enabled):
+        """Keep raw decodes of still images on disk so later runs map them instead of decoding"""
+        image_cache.persist = enabled
+
+    def set_use_proxies(self, enabled):
+        """Play videos from intra-frame proxies, transcoding missing ones in the background"""
+        proxy_cache.enabled = enabled
+        for mask in self.get_all_masks():
+            media = mask.media
+            if not media or not media.ready or not media.is_video or media.is_sequence:
+                continue
+            if not enabled:
+                if media.proxy_path:
+                    self.reopen_media(mask)
+            elif proxy_cache.get_proxy(media.path):
+                self.reopen_media(mask)
+            else:
+                proxy_cache.request(media.path)
+
+    def on_proxy_ready(self, path):
+        """A proxy finished transcoding; move the masks playing its original onto it"""
+        if not proxy_cache.enabled:
+            return
+        for mask in self.get_all_masks():
+            media = mask.media
+            if media and media.ready and media.path == path and not media.proxy_path:
+                self.reopen_media(mask)
+        self.statusBar().showMessage(f"Proxy ready: {os.path.basename(path)}", 3000)
+
+    def set_render_at_window_resolution(self, enabled):
+        """Render at the projection window's size instead of the project's projection size"""
+        self.projection_window.set_match_window_resolution(enabled)
 
     def toggle_projection_window(self):
         if self.projection_window.isVisible():
@@ -351,6 +631,7 @@ class ProjectionMapper(QMainWindow):
             self.masks = []
             self.current_file = None
             self.current_project_path = None
+            self.resource_manager.activate(None, self.masks)
 
             # Create initial mask
             self.create_initial_mask()
@@ -403,6 +684,7 @@ class ProjectionMapper(QMainWindow):
             if success:
                 self.current_file = file_path
                 self.current_project_path = file_path
+                self.resource_manager.activate(file_path, self.masks)
 
                 # Add to project list and loaded projects
                 self.control_window.project_list_widget.add_project(file_path)
@@ -435,7 +717,8 @@ class ProjectionMapper(QMainWindow):
             self.control_window.project_list_widget.remove_project(file_path)
             return
 
-        project_data = ProjectSerializer.load_project(file_path)
+        # Masks come back immediately; their media keeps opening in the background
+        project_data = ProjectSerializer.load_project(file_path, self.media_loader)
 
         if project_data:
             # Save current project state before switching
@@ -448,7 +731,7 @@ class ProjectionMapper(QMainWindow):
             if not self.current_project_path or self.current_project_path not in self.loaded_projects:
                 for mask in self.masks:
                     if mask.media:
-                        mask.media.release()
+                        self.release_media(mask.media)
 
             # Create a new masks list for this project
             new_masks = list(project_data["masks"])
@@ -467,15 +750,14 @@ class ProjectionMapper(QMainWindow):
             self.projection_height = project_data["projection_height"]
             self.current_file = file_path
             self.current_project_path = file_path
+            self.resource_manager.activate(file_path, self.masks)
 
             # Add to project list if not already there
             self.control_window.project_list_widget.add_project(file_path)
             self.control_window.project_list_widget.set_selected_project(file_path)
 
             # Update renderer with new projection size
-            self.renderer.width = self.projection_width
-            self.renderer.height = self.projection_height
-            self.renderer.canvas = None  # Will be recreated on next render
+            self.renderer.resize(self.projection_width, self.projection_height)
 
             # Update projection window
             self.projection_window.setFixedSize(self.projection_width, self.projection_height)
@@ -494,6 +776,13 @@ class ProjectionMapper(QMainWindow):
         else:
             QMessageBox.critical(self, "Error", f"Failed to load project:\n{file_path}")
 
+    def on_media_load_progress(self, done, total):
+        """Show background media loading progress in the status bar"""
+        if done < total:
+            self.statusBar().showMessage(f"Opening media {done}/{total}...")
+        else:
+            self.statusBar().showMessage(f"Opened {total} media", 3000)
+
     def save_current_project_state(self):
         """Save the current project state to the loaded_projects dictionary"""
         if self.current_project_path and self.current_project_path in self.loaded_projects:
@@ -514,6 +803,7 @@ class ProjectionMapper(QMainWindow):
             self.control_window.project_list_widget.remove_project(file_path)
             if file_path in self.loaded_projects:
                 del self.loaded_projects[file_path]
+            self.resource_manager.forget(file_path)
             return
 
         # Save current project state before switching (keep masks list reference)
@@ -533,11 +823,11 @@ class ProjectionMapper(QMainWindow):
             self.projection_height = project_data["projection_height"]
             self.current_file = file_path
             self.current_project_path = file_path
+            # Reopen its media if it was suspended, and suspend the least recently used others
+            self.resource_manager.activate(file_path, self.masks)
 
             # Update renderer with new projection size
-            self.renderer.width = self.projection_width
-            self.renderer.height = self.projection_height
-            self.renderer.canvas = None  # Will be recreated on next render
+            self.renderer.resize(self.projection_width, self.projection_height)
 
             # Update projection window
             self.projection_window.setFixedSize(self.projection_width, self.projection_height)
@@ -589,13 +879,48 @@ class ProjectionMapper(QMainWindow):
         else:
             self.setWindowTitle("BadMapper - Editor")
 
+    def wait_for_media(self):
+        """Wait for media still opening in the background; False if the user gave up"""
+        from PyQt5.QtWidgets import QProgressDialog
+        from PyQt5.QtCore import QEventLoop
+
+        if self.media_loader.is_busy():
+            progress = QProgressDialog("Opening media...", "Cancel", 0, self.media_loader.total, self)
+            progress.setWindowTitle("Opening Media")
+            progress.setWindowModality(Qt.WindowModal)
+            progress.setValue(self.media_loader.done)
+
+            loop = QEventLoop()
+            self.media_loader.progress.connect(progress.setValue)
+            self.media_loader.finished.connect(loop.quit)
+            progress.canceled.connect(loop.quit)
+            try:
+                if self.media_loader.is_busy():
+                    progress.show()
+                    loop.exec_()
+            finally:
+                self.media_loader.progress.disconnect(progress.setValue)
+                self.media_loader.finished.disconnect(loop.quit)
+                progress.close()
+            if self.media_loader.is_busy():
+                return False
+
+        # Masks whose media failed to open have lost it; anything still pending isn't loaded
+        return not any(mask.media and not mask.media.ready for mask in self.masks)
+
     def export_video(self):
         """Export the projection window as an MP4 video"""
-        from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QSpinBox, QPushButton, QHBoxLayout, QProgressDialog, QTextEdit
+        from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QSpinBox, QPushButton, QHBoxLayout, QProgressDialog, QTextEdit, QCheckBox
         from PyQt5.QtCore import QThread, pyqtSignal
         import cv2
         import math
 
+        # Placeholders would be exported as posters or black frames
+        if not self.wait_for_media():
+            QMessageBox.warning(self, "Media Not Loaded",
+                                "Export needs every mask's media to be open. Try again once it has loaded.")
+            return
+
         def gcd(a, b):
             """Calculate Greatest Common Divisor"""
             while b:
@@ -618,12 +943,18 @@ class ProjectionMapper(QMainWindow):
         # Collect all video durations
         video_durations = []
         for mask in self.masks:
-            if mask.media and mask.media.is_video and mask.media.cap:
-                # Get total frame count and FPS
-                frame_count = mask.media.cap.get(cv2.CAP_PROP_FRAME_COUNT)
-                fps = mask.media.cap.get(cv2.CAP_PROP_FPS)
-                if frame_count > 0 and fps > 0:
-                    video_duration = int(frame_count / fps)
+            if mask.media and mask.media.is_sequence:
+                # Sequences know their length at the rate they're played at
+                duration = mask.media.get_duration()
+                if duration > 0:
+                    video_duration = int(duration / mask.media.rate)
+                    if video_duration > 0:
+                        video_durations.append(video_duration)
+            elif mask.media and mask.media.is_video:
+                # Duration from the probe cache; only files never opened are probed here
+                probe = probe_cache.probe(mask.media.path, is_video=True)
+                if probe and probe["duration"] > 0:
+                    video_duration = int(probe["duration"] / mask.media.rate)
                     if video_duration > 0:
                         video_durations.append(video_duration)
 
@@ -673,6 +1004,13 @@ class ProjectionMapper(QMainWindow):
         fps_spinbox.setValue(30)
         layout.addWidget(fps_spinbox)
 
+        # Proxies are for live playback; export can go back to the originals
+        originals_checkbox = QCheckBox("Render from original videos instead of proxies")
+        originals_checkbox.setChecked(True)
+        if any(mask.media and mask.media.ready and mask.media.is_video and mask.media.proxy_path
+               for mask in self.masks):
+            layout.addWidget(originals_checkbox)
+
         # Buttons
         button_layout = QHBoxLayout()
         ok_button = QPushButton("Export")
@@ -720,29 +1058,50 @@ class ProjectionMapper(QMainWindow):
                     frame_count = duration * fps
                     was_canceled = False
 
-                    for i in range(frame_count):
-                        if progress.wasCanceled():
-                            was_canceled = True
-                            break
-
-                        # Render current frame
-                        self.renderer.reset_canvas()
-                        for mask in self.masks:
-                            if mask.media:
-                                self.renderer.render_mask(mask)
-
-                        # Draw grids if enabled
-                        if self.renderer.show_grid:
-                            for mask in self.masks:
-                                self.renderer.draw_grid(mask)
-
-                        # Get the output frame
-                        frame = self.renderer.get_output()
-
-                        if frame is not None:
-                            out.write(frame)
-
-                        progress.setValue(i + 1)
+                    # Render a snapshot of the scene, swapping proxies for originals if asked
+                    export_masks = [mask.snapshot() for mask in self.masks]
+                    originals = []
+                    if originals_checkbox.isChecked():
+                        for mask in export_masks:
+                            media = mask.media
+                            if media and media.ready and media.is_video and media.proxy_path:
+                                mask.media = media.reopen(use_proxy=False)
+                                originals.append(mask.media)
+
+                    # Keep the render thread off the renderer and media while exporting
+                    with self.render_thread.paused():
+                        # Render at the export resolution, not the window's, and
+                        # wait for every decoded frame instead of dropping any
+                        self.renderer.set_output_size(width, height)
+                        self.renderer.block_on_decode = True
+                        try:
+                            for i in range(frame_count):
+                                if progress.wasCanceled():
+                                    was_canceled = True
+                                    break
+
+                                # Render current frame
+                                self.renderer.reset_canvas()
+                                self.renderer.render_masks(export_masks, now=i / fps)
+
+                                # Draw grids if enabled
+                                if self.renderer.show_grid:
+                                    for mask in export_masks:
+                                        self.renderer.draw_grid(mask)
+
+                                # Get the output frame
+                                self.renderer.publish()
+                                frame = self.renderer.get_output()
+
+                                if frame is not None:
+                                    out.write(cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR))
+
+                                progress.setValue(i + 1)
+                        finally:
+                            self.renderer.block_on_decode = False
+                            self.projection_window.update_output_size()
+                            for media in originals:
+                                media.release()
 
                     out.release()
                     progress.close()
@@ -759,10 +1118,21 @@ class ProjectionMapper(QMainWindow):
                     QMessageBox.critical(self, "Error", f"Failed to export video: {str(e)}")
 
     def closeEvent(self, event):
-        # Clean up media resources
-        for mask in self.masks:
-            if mask.media:
-                mask.media.release()
+        self.scheduler.stop()
+        self.render_thread.stop()
+        self.media_loader.shutdown()
+        proxy_cache.shutdown()
+
+        # Clean up media resources, including those of inactive projects
+        mask_lists = [self.masks] + [project["masks"] for project in self.loaded_projects.values()]
+        released = set()
+        for masks in mask_lists:
+            for mask in masks:
+                if mask.media and id(mask) not in released:
+                    released.add(id(mask))
+                    mask.media.release()
 
+        frame_cache.shutdown()
+        self.renderer.shutdown()
         self.projection_window.close()
         event.accept()
@@ -0,0 +1,182 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+
+class WebcamCapture(threading.Thread):
+    """Reads a webcam on its own thread, keeping only the newest frame.
+
+    The render thread never waits on the driver: take() returns the newest
+    frame captured since the last call, or None. If the device stops
+    delivering frames, the capture is reopened in the background while
+    consumers keep showing their last frame.
+    """
+
+    def __init__(self, cap, open_capture, ingest=None, reconnect_delay=1.0, max_failures=5):
+        super().__init__(name="webcam-capture", daemon=True)
+        self.cap = cap
+        self.open_capture = open_capture  # Returns a new capture for the same device
+        self.ingest = ingest  # Applied to each frame on this thread (e.g. downscaling)
+        self.reconnect_delay = reconnect_delay
+        self.max_failures = max_failures  # Consecutive failed reads before reconnecting
+
+        self._latest = None  # (frame, capture time)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        # Stats
+        self.connected = True
+        self.frames_captured = 0
+        self.frames_dropped = 0  # Captured but replaced before anyone took them
+        self.reconnects = 0
+        self.latency = 0.0  # Seconds between capture and take(), smoothed
+        self._last_capture = None
+        self._interval = None  # Seconds between captured frames, smoothed
+
+        set_low_latency(cap)
+
+    def stop(self):
+        self._stopping.set()
+        if self.is_alive():
+            # A read stuck in the driver can't be interrupted; don't hang on it
+            self.join(timeout=2.0)
+
+    def take(self):
+        """Return the newest frame not yet taken, or None"""
+        with self._lock:
+            entry, self._latest = self._latest, None
+        if entry is None:
+            return None
+        frame, captured = entry
+        self.latency = 0.9 * self.latency + 0.1 * (time.monotonic() - captured)
+        return frame
+
+    def _reconnect(self):
+        cap = self.open_capture()
+        if not cap.isOpened():
+            cap.release()
+            return False
+        set_low_latency(cap)
+        self.cap = cap
+        self.connected = True
+        self.reconnects += 1
+        self._last_capture = None
+        print("Webcam reconnected")
+        return True
+
+    def run(self):
+        failures = 0
+        while not self._stopping.is_set():
+            if self.cap is None:
+                if not self._reconnect():
+                    self._stopping.wait(self.reconnect_delay)
+                    continue
+                failures = 0
+
+            ret, frame = self.cap.read()
+            now = time.monotonic()
+            if not ret:
+                failures += 1
+                if failures >= self.max_failures:
+                    print("Warning: Webcam stopped delivering frames, reconnecting")
+                    self.cap.release()
+                    self.cap = None
+                    self.connected = False
+                else:
+                    self._stopping.wait(0.01)
+                continue
+            failures = 0
+
+            if self.ingest is not None:
+                frame = self.ingest(frame)
+
+            if self._last_capture is not None:
+                # Smooth the interval, not its reciprocal, so one burst doesn't skew the rate
+                interval = now - self._last_capture
+                self._interval = interval if self._interval is None else 0.9 * self._interval + 0.1 * interval
+            self._last_capture = now
+
+            with self._lock:
+                if self._latest is not None:
+                    self.frames_dropped += 1
+                self._latest = (frame, now)
+            self.frames_captured += 1
+
+        if self.cap is not None:
+            self.cap.release()
+
+    @property
+    def capture_fps(self):
+        return 1.0 / self._interval if self._interval else 0.0
+
+    def get_stats(self):
+        return {
+            "connected": self.connected,
+            "capture_fps": self.capture_fps,
+            "latency_ms": self.latency * 1000,
+            "frames_captured": self.frames_captured,
+            "frames_dropped": self.frames_dropped,
+            "reconnects": self.reconnects,
+        }
+
+
+def set_low_latency(cap):
+    """Ask the driver to buffer as few frames as possible (not every backend supports it)"""
+    try:
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    except cv2.error:
+        pass
+
+
+class FakeCapture:
+    """Stand-in for cv2.VideoCapture that generates a moving test pattern.
+
+    Lets webcam media run without a camera (see MediaSource.capture_factory).
+    Device indices in FakeCapture.unplugged behave like a disconnected camera.
+    """
+
+    unplugged = set()
+
+    def __init__(self, index=0, width=640, height=480, fps=30.0):
+        self.index = index
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame_number = 0
+        self._opened = index not in FakeCapture.unplugged
+        self._next_frame = time.monotonic()
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        if not self._opened or self.index in FakeCapture.unplugged:
+            return False, None
+
+        # Block until the next frame is due, like a real driver
+        delay = self._next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_frame = max(self._next_frame + 1.0 / self.fps, time.monotonic())
+
+        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        x = (self.frame_number * 8) % self.width
+        frame[:, x:x + 8] = 255
+        cv2.putText(frame, str(self.frame_number), (20, self.height // 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 255, 0), 3)
+        self.frame_number += 1
+        return True, frame
+
+    def get(self, prop):
+        return {
+            cv2.CAP_PROP_FPS: self.fps,
+            cv2.CAP_PROP_FRAME_WIDTH: self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+        }.get(prop, 0.0)
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self._opened = False
@@ -0,0 +1,56 @@
+import hashlib
+import os
+import threading
+
+
+class ContentKeys:
+    """Content hashes of files, so copies share cached data and edits don't.
+
+    A key hashes the whole file: caches on disk trust it across runs, so
+    two files must never share one unless their bytes match. Keys are
+    remembered per path, size and modification time, so each file is only
+    read once per session.
+    """
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = {}  # (path, size, mtime) -> content key
+
+    @staticmethod
+    def _file_id(path):
+        stat = os.stat(path)
+        return os.path.normcase(os.path.abspath(path)), stat.st_size, stat.st_mtime_ns
+
+    def peek(self, path):
+        """Content key of path if it's already known, without reading the file; None otherwise"""
+        try:
+            file_id = self._file_id(path)
+        except OSError:
+            return None
+        with self._lock:
+            return self._keys.get(file_id)
+
+    def get(self, path):
+        """Content key of path; raises OSError if it can't be read"""
+        file_id = self._file_id(path)
+        with self._lock:
+            key = self._keys.get(file_id)
+        if key is not None:
+            return key
+
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        key = digest.hexdigest()
+        with self._lock:
+            self._keys[file_id] = key
+        return key
+
+
+content_keys = ContentKeys()
@@ -0,0 +1,228 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows, where a file open in another process can't be deleted anyway
+
+
+class FrameStore:
+    """Every decoded frame of one clip, in RAM or in a memory-mapped file"""
+
+    def __init__(self, key, shape, count, path=None):
+        self.key = key
+        self.count = count
+        self.path = path
+        if path:
+            self.frames = np.memmap(path, dtype=np.uint8, mode="w+", shape=(count,) + tuple(shape))
+        else:
+            self.frames = np.empty((count,) + tuple(shape), dtype=np.uint8)
+        self.nbytes = self.frames.nbytes
+        self.ready = False  # All frames decoded; safe to play from
+        self.evicted = False
+        self.filler = None  # Thread decoding into the store, if any
+
+    @property
+    def on_disk(self):
+        return self.path is not None
+
+    def get(self, index):
+        """Zero-copy view of the frame at a (looping) playback index"""
+        return self.frames[index % self.count]
+
+    def finish(self, count):
+        """Mark the store complete with the clip's actual frame count"""
+        if self.evicted:
+            return
+        self.count = count
+        self.frames.flags.writeable = False
+        self.ready = True
+
+    def close(self):
+        # Views handed out earlier keep their memory alive; we only drop ours
+        self.ready = False
+        self.evicted = True
+        self.frames = None
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                print(f"Warning: Could not remove frame cache file {self.path}: {e}")
+
+
+class FrameCache:
+    """Global budget for decoded clips, shared by all media.
+
+    Stores go to RAM while they fit in ram_budget, then to memory-mapped files
+    in directory while they fit in disk_budget. When neither fits, the least
+    recently played stores are evicted.
+
+    Each process keeps its files in its own subdirectory, locked while it
+    runs. Files that couldn't be deleted (Windows won't delete a file that
+    is still mapped) or that a crash left behind are removed by the next
+    run, once no process holds their directory.
+    """
+
+    def __init__(self, ram_budget=1024 * 1024 * 1024, disk_budget=4 * 1024 * 1024 * 1024,
+                 max_clip_bytes=1024 * 1024 * 1024, directory=None):
+        self.ram_budget = ram_budget
+        self.disk_budget = disk_budget
+        self.max_clip_bytes = max_clip_bytes
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "badmapper-frames")
+
+        self._stores = OrderedDict()  # key -> FrameStore, least recently used first
+        self._lock = threading.Lock()
+        self._process_dir = None  # This process's subdirectory, created with the first file
+        self._dir_lock = None  # Open lock file marking it as in use
+
+        # Stats
+        self.evictions = 0
+
+    def _used(self, on_disk):
+        return sum(store.nbytes for store in self._stores.values() if store.on_disk == on_disk)
+
+    def get(self, key):
+        with self._lock:
+            store = self._stores.get(key)
+            if store is not None:
+                self._stores.move_to_end(key)
+            return store
+
+    def touch(self, store):
+        """Mark a store as just played"""
+        with self._lock:
+            if self._stores.get(store.key) is store:
+                self._stores.move_to_end(store.key)
+
+    def allocate(self, key, shape, count):
+        """Create an empty store for count frames, or return None if it can't fit"""
+        nbytes = int(np.prod(shape)) * count
+        if nbytes > self.max_clip_bytes or nbytes > max(self.ram_budget, self.disk_budget):
+            return None
+
+        with self._lock:
+            while True:
+                if self._used(False) + nbytes <= self.ram_budget:
+                    path = None
+                    break
+                if self._used(True) + nbytes <= self.disk_budget:
+                    try:
+                        fd, path = tempfile.mkstemp(suffix=".frames", dir=self._get_process_dir())
+                    except OSError as e:
+                        print(f"Warning: Could not create frame cache file: {e}")
+                        return None
+                    os.close(fd)
+                    break
+                if not self._stores:
+                    return None
+                _, evicted = self._stores.popitem(last=False)
+                evicted.close()
+                self.evictions += 1
+
+            try:
+                store = FrameStore(key, shape, count, path)
+            except (OSError, MemoryError) as e:
+                print(f"Warning: Could not allocate frame cache: {e}")
+                if path:
+                    os.remove(path)
+                return None
+            self._stores[key] = store
+            return store
+
+    def remove(self, store):
+        with self._lock:
+            if self._stores.get(store.key) is store:
+                del self._stores[store.key]
+        store.close()
+
+    def _get_process_dir(self):
+        if self._process_dir is None:
+            self.remove_leftovers()
+            path = os.path.join(self.directory, str(os.getpid()))
+            os.makedirs(path, exist_ok=True)
+            self._dir_lock = open(os.path.join(path, "lock"), "w")
+            if fcntl is not None:
+                fcntl.flock(self._dir_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._process_dir = path
+        return self._process_dir
+
+    @staticmethod
+    def _is_in_use(path):
+        """True while the process that owns a frame file directory is running"""
+        lock_path = os.path.join(path, "lock")
+        if fcntl is None:
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                return False
+            except OSError:
+                return True  # Still open in its process
+            return False
+
+        try:
+            lock = open(lock_path, "a")
+        except FileNotFoundError:
+            return False
+        except OSError:
+            return True
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+            return False
+
+    def remove_leftovers(self):
+        """Delete frame files left in directory by runs that are no longer running"""
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir() and entry.path != self._process_dir and not self._is_in_use(entry.path):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def clear(self):
+        with self._lock:
+            stores = list(self._stores.values())
+            self._stores.clear()
+        for store in stores:
+            store.close()
+
+    def shutdown(self):
+        """Stop background fills, then drop every store and this process's files"""
+        with self._lock:
+            stores = list(self._stores.values())
+        # Fillers keep their own mapping of the file; it must be closed before
+        # the file can be deleted on Windows
+        for store in stores:
+            store.evicted = True
+        for store in stores:
+            if store.filler is not None and store.filler.is_alive():
+                store.filler.join()
+        self.clear()
+
+        if self._process_dir is not None:
+            self._dir_lock.close()
+            shutil.rmtree(self._process_dir, ignore_errors=True)
+            self._process_dir = self._dir_lock = None
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "stores": len(self._stores),
+                "ram_bytes": self._used(False),
+                "disk_bytes": self._used(True),
+                "evictions": self.evictions,
+            }
+
+
+frame_cache = FrameCache()
+# Stop background fills before the interpreter tears down their threads
+atexit.register(frame_cache.shutdown)
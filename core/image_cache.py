@@ -0,0 +1,147 @@
+import os
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from core.content_key import content_keys
+
+
+class ImageCache:
+    """Decoded still images, shared by every mask and project that shows them.
+
+    Images are keyed by file content, so the same logo under several paths
+    is decoded once. Arrays are handed out read-only. The least recently
+    used ones are dropped past max_bytes (masks still showing them keep
+    their reference). With persist enabled, decodes are also kept on disk
+    as raw .npy files and memory-mapped on later runs instead of decoding
+    the PNG/JPEG again.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, directory=None, max_disk_bytes=2 * 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.directory = directory or os.path.join(os.path.expanduser("~"), ".cache", "badmapper", "images")
+        self.max_disk_bytes = max_disk_bytes
+        self.persist = False  # Keep raw decodes on disk across runs
+
+        self._lock = threading.Lock()
+        self._images = OrderedDict()  # Content key -> read-only array, least recently used first
+        self._bytes = 0
+
+        # Stats
+        self.hits = 0
+        self.decodes = 0
+        self.disk_loads = 0
+        self.evictions = 0
+
+    def get(self, path, max_pixels=None):
+        """Decoded image at path as a read-only BGR array, or None if it can't be read.
+
+        Images with more than max_pixels pixels are decoded for the caller
+        only, without being kept or persisted (e.g. ones about to be tiled).
+        """
+        try:
+            key = content_keys.get(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image
+
+        image = self._load_persisted(key) if self.persist else None
+        decoded = image is None
+        if decoded:
+            image = cv2.imread(path)
+            if image is None:
+                return None
+            self.decodes += 1
+            image.flags.writeable = False
+        if max_pixels is not None and image.shape[0] * image.shape[1] > max_pixels:
+            return image
+        if decoded and self.persist:
+            self._persist(key, image)
+
+        with self._lock:
+            if key in self._images:
+                # Another thread decoded it meanwhile; share theirs
+                return self._images[key]
+            self._images[key] = image
+            self._bytes += image.nbytes
+            while self._bytes > self.max_bytes and len(self._images) > 1:
+                _, evicted = self._images.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+        return image
+
+    def _npy_path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def _load_persisted(self, key):
+        path = self._npy_path(key)
+        try:
+            image = np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read cached image {path}: {e}")
+            return None
+        try:
+            os.utime(path)  # Most recently used files survive trimming
+        except OSError:
+            pass
+        self.disk_loads += 1
+        return image
+
+    def _persist(self, key, image):
+        path = self._npy_path(key)
+        partial = path + ".partial"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(partial, "wb") as f:
+                np.save(f, image)
+            os.replace(partial, path)
+        except OSError as e:
+            print(f"Warning: Could not cache decoded image: {e}")
+            return
+        self._trim_disk()
+
+    def _trim_disk(self):
+        """Delete the least recently used raw decodes past max_disk_bytes"""
+        try:
+            files = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".npy")]
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in files]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            entries, used = len(self._images), self._bytes
+        return {
+            "entries": entries,
+            "bytes": used,
+            "hits": self.hits,
+            "decodes": self.decodes,
+            "disk_loads": self.disk_loads,
+            "evictions": self.evictions,
+            "persist": self.persist,
+        }
+
+
+image_cache = ImageCache()
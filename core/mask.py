@@ -10,6 +10,8 @@ class MaskType(Enum):
 class Mask:
     def __init__(self, mask_type, width=400, height=300, position=(100, 100)):
         self.mask_type = mask_type
+        # Bumped on every geometry change so renderers can cache derived data
+        self.version = 0
         self.width = width
         self.height = height
         self.position = position
@@ -50,11 +52,21 @@ class Mask:
             [x, y + self.height]
         ], dtype=np.float32)
 
+    @property
+    def vertices(self):
+        return self._vertices
+
+    @vertices.setter
+    def vertices(self, vertices):
+        self._vertices = vertices
+        self.version += 1
+
     def get_center(self):
         return np.mean(self.vertices, axis=0)
 
     def set_vertex(self, index, point):
         self.vertices[index] = point
+        self.version += 1
 
     def translate(self, dx, dy):
         self.vertices += np.array([dx, dy])
@@ -98,14 +110,42 @@ class Mask:
         self.vertices = self.original_vertices.copy()
 
     def get_bounds(self):
-        min_x = np.min(self.vertices[:, 0])
-        min_y = np.min(self.vertices[:, 1])
-        max_x = np.max(self.vertices[:, 0])
-        max_y = np.max(self.vertices[:, 1])
-        return min_x, min_y, max_x, max_y
+        return _get_bounds(self.vertices)
+
+    @property
+    def source(self):
+        """The live mask this state belongs to (snapshots point back to it)"""
+        return self
+
+    def snapshot(self):
+        """Copy the state needed for rendering so it can be handed to the render thread"""
+        return MaskSnapshot(self)
+
+class MaskSnapshot:
+    """Frozen copy of a mask's render state, taken on the GUI thread"""
+
+    def __init__(self, mask):
+        self.source = mask
+        self.mask_type = mask.mask_type
+        self.version = mask.version
+        self.vertices = mask.vertices.copy()
+        self.media = mask.media
+        self.media_transform = mask.media_transform.copy()
+
+    def get_bounds(self):
+        return _get_bounds(self.vertices)
+
+def _get_bounds(vertices):
+    min_x = np.min(vertices[:, 0])
+    min_y = np.min(vertices[:, 1])
+    max_x = np.max(vertices[:, 0])
+    max_y = np.max(vertices[:, 1])
+    return min_x, min_y, max_x, max_y
 
 class MediaTransform:
     def __init__(self):
+        # Bumped whenever any transform field is assigned
+        self.version = 0
         self.offset_x = 0
         self.offset_y = 0
         self.scale = 1.0
@@ -118,3 +158,91 @@ class MediaTransform:
         self.scale = 1.0
         self.rotation = 0.0
         self.perspective_points = None
+
+    def copy(self):
+        """Return a copy with the same fields and version"""
+        transform = MediaTransform()
+        transform.offset_x = self.offset_x
+        transform.offset_y = self.offset_y
+        transform.scale = self.scale
+        transform.rotation = self.rotation
+        if self.perspective_points is not None:
+            transform.perspective_points = self.perspective_points.copy()
+        transform.version = self.version
+        return transform
+
+    def crops_media(self):
+        """Whether rotation or scale push part of the media outside its original frame"""
+        return self.rotation != 0 or self.scale != 1.0
+
+    def get_rotation_matrix(self, media_w, media_h):
+        """Return the 3x3 matrix that rotates the media around its center"""
+        matrix = np.eye(3)
+        if self.rotation != 0:
+            center = (media_w / 2, media_h / 2)
+            matrix[:2] = cv2.getRotationMatrix2D(center, self.rotation, 1.0)
+        return matrix
+
+    def get_scale_matrix(self, media_w, media_h):
+        """Return the 3x3 matrix that scales the media, keeping it centered in its frame"""
+        if self.scale == 1.0:
+            return np.eye(3)
+
+        new_w = max(1, int(media_w * self.scale))
+        new_h = max(1, int(media_h * self.scale))
+        sx = new_w / media_w
+        sy = new_h / media_h
+
+        if new_w < media_w or new_h < media_h:
+            # Pad
+            shift_x = max(0, (media_w - new_w) // 2)
+            shift_y = max(0, (media_h - new_h) // 2)
+        else:
+            # Crop
+            shift_x = -((new_w - media_w) // 2)
+            shift_y = -((new_h - media_h) // 2)
+
+        # Pixel-center aligned, matching cv2.resize
+        return np.array([
+            [sx, 0, 0.5 * (sx - 1) + shift_x],
+            [0, sy, 0.5 * (sy - 1) + shift_y],
+            [0, 0, 1]
+        ])
+
+    def get_media_matrix(self, media_w, media_h):
+        """Return the 3x3 matrix applying rotation then scale to the media"""
+        return self.get_scale_matrix(media_w, media_h) @ self.get_rotation_matrix(media_w, media_h)
+
+    def get_mask_matrix(self, media_w, media_h, vertices):
+        """Return the 3x3 matrix that maps the (offset) media frame onto the mask vertices"""
+        # Offset the media within the mask space
+        offset_scale = 0.5  # Scale offset relative to mask size
+        offset = np.array([self.offset_x, self.offset_y], dtype=np.float32) * offset_scale
+
+        if len(vertices) == 3:
+            # For triangles, use affine transform with 3 points
+            media_triangle = np.array([
+                [0, 0],
+                [media_w, 0],
+                [media_w / 2, media_h]
+            ], dtype=np.float32) - offset
+            M = cv2.getAffineTransform(media_triangle, vertices.astype(np.float32))
+            return np.vstack([M, [0, 0, 1]])
+
+        # For rectangles/quads, use perspective transform with 4 points
+        media_points = np.array([
+            [0, 0],
+            [media_w, 0],
+            [media_w, media_h],
+            [0, media_h]
+        ], dtype=np.float32) - offset
+        return cv2.getPerspectiveTransform(media_points, vertices[:4].astype(np.float32))
+
+    def compile(self, media_w, media_h, vertices):
+        """Return a single 3x3 matrix mapping source media pixels to mask space"""
+        return self.get_mask_matrix(media_w, media_h, vertices) @ self.get_media_matrix(media_w, media_h)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name != 'version':
+            super().__setattr__('version', self.version + 1)
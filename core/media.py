@@ -1,16 +1,302 @@
+import os
+import threading
+import time
+from collections import deque
 import cv2
 import numpy as np
+from core.frame_cache import frame_cache
+from core.capture import WebcamCapture
+from core.proxy import proxy_cache
+from core.probe import probe_cache
+from core.image_cache import image_cache
+from core.tiled_image import TiledImage
+from core.sequence import ImageSequence, SequenceDecoder, is_sequence_path
 
-class Media:
-    def __init__(self, path, is_webcam=False, webcam_index=0):
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+
+class VideoReader:
+    """Reads a looping video by playback frame index.
+
+    Indices are "unwrapped": they keep counting across loops, so index N is
+    the first frame again for an N-frame clip. Frames between the current
+    position and the requested one are skipped with grab() (no decode);
+    backwards or long jumps seek instead.
+
+    With a spare capture (a second capture of the same file, parked at frame
+    0), looping is gapless: at end of file the reader switches to the spare
+    instead of seeking, and rewinds the exhausted capture in the background
+    to become the next spare.
+    """
+
+    def __init__(self, cap, fps, position=0, spare=None):
+        self.cap = cap
+        self.spare = spare
+        self._primer = None  # Thread rewinding the spare
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frame_count = frame_count if frame_count > 0 else None
+        self.frame_count_exact = False  # True once a loop has been read to the end
+        self.position = position  # Playback index of the next frame read() returns
+        self.file_index = position  # Index of that frame within the file
+        # Beyond this many frames, seeking is cheaper than grabbing
+        self.max_skip = max(1, int((fps or 30.0) * 2))
+
+        # Stats
+        self.loops = 0
+        self.seeks = 0
+
+    def seek(self, index):
+        self.file_index = index % self.frame_count if self.frame_count else index
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.file_index)
+        self.position = index
+        self.seeks += 1
+
+    def _wrap(self):
+        # End of file: the file is exactly file_index frames long, loop back to its start
+        if self.file_index > 0:
+            self.frame_count = self.file_index
+            self.frame_count_exact = True
+        self.file_index = 0
+        self.loops += 1
+
+        if self.spare is None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return
+
+        if self._primer is not None:
+            self._primer.join()
+        exhausted, self.cap, self.spare = self.cap, self.spare, None
+
+        def prime():
+            exhausted.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.spare = exhausted
+
+        self._primer = threading.Thread(target=prime, name="media-prime", daemon=True)
+        self._primer.start()
+
+    def _at_end(self):
+        return self.frame_count_exact and self.file_index >= self.frame_count
+
+    def read(self, index):
+        """Decode the frame at playback index, or return None if the stream is unreadable"""
+        if index < self.position or index - self.position > self.max_skip:
+            self.seek(index)
+
+        # Skip frames we are late for without decoding them
+        while self.position < index:
+            if self._at_end():
+                self._wrap()
+            elif self.cap.grab():
+                self.position += 1
+                self.file_index += 1
+            elif self.file_index > 0:
+                self._wrap()
+            else:
+                return None
+
+        if self._at_end():
+            self._wrap()
+        ret, frame = self.cap.read()
+        if not ret:
+            self._wrap()
+            ret, frame = self.cap.read()
+            if not ret:
+                return None
+        self.position += 1
+        self.file_index += 1
+        return frame
+
+    def release(self):
+        if self._primer is not None:
+            self._primer.join()
+        self.cap.release()
+        if self.spare is not None:
+            self.spare.release()
+
+class FrameDecoder(threading.Thread):
+    """Decodes a looping video ahead of playback into a bounded queue"""
+
+    def __init__(self, reader, depth, ingest=None):
+        super().__init__(name="media-decode", daemon=True)
+        self.reader = reader
+        self.depth = depth
+        self.ingest = ingest  # Applied to each frame on this thread (e.g. downscaling)
+        self.frames = deque()  # (playback index, frame), in decode order
+        self.target = reader.position  # Playback index the consumer wants next
+        self._seek_to = None
+        self._cond = threading.Condition()
+        self._running = False
+
+        # Stats
+        self.frames_decoded = 0
+
+    def start(self):
+        self._running = True
+        super().start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join()
+
+    def seek(self, index):
+        """Drop queued frames and continue decoding from index"""
+        with self._cond:
+            self.frames.clear()
+            self._seek_to = index
+            self.target = index
+            self._cond.notify_all()
+
+    def take(self, target, block=False):
+        """Return the newest decoded (index, frame) at or before target, or None.
+
+        Older queued frames are dropped. With block=True, waits until the frame
+        at target has been decoded, dropping frames before target first so the
+        decoder has room to jump ahead to it.
+        """
+        with self._cond:
+            self.target = target
+            if block:
+                while self.frames and self.frames[0][0] < target:
+                    self.frames.popleft()
+            self._cond.notify_all()
+            if block:
+                self._cond.wait_for(lambda: not self._running or
+                                    (self.frames and self.frames[-1][0] >= target),
+                                    timeout=1.0)
+
+            entry = None
+            while self.frames and self.frames[0][0] <= target:
+                entry = self.frames.popleft()
+            self._cond.notify_all()
+            return entry
+
+    def _queued_ahead(self):
+        """Queued frames the consumer hasn't passed yet; the rest are free space"""
+        return sum(1 for index, _ in self.frames if index >= self.target)
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: not self._running or self._seek_to is not None or
+                                    self._queued_ahead() < self.depth)
+                if not self._running:
+                    break
+                if self._seek_to is not None:
+                    index = self._seek_to
+                    self._seek_to = None
+                else:
+                    # Don't decode frames the consumer is already past
+                    index = max(self.reader.position, self.target)
+
+            frame = self.reader.read(index)
+            if frame is None:
+                # Unreadable stream; the consumer keeps its last frame
+                break
+            if self.ingest is not None:
+                frame = self.ingest(frame)
+            self.frames_decoded += 1
+
+            with self._cond:
+                # A seek while decoding makes this frame stale
+                if self._seek_to is None:
+                    self.frames.append((index, frame))
+                    self._cond.notify_all()
+
+def fill_frame_store(store, path):
+    """Decode every frame of path into store; runs on its own thread and capture"""
+    cap = cv2.VideoCapture(path)
+    frames = store.frames  # Eviction drops the store's reference, not ours
+    count = 0
+    try:
+        while not store.evicted:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if count >= len(frames) or frame.shape != frames.shape[1:]:
+                print(f"Warning: {path} doesn't match its reported size; not caching its frames")
+                count = 0
+                break
+            frames[count] = frame
+            count += 1
+    finally:
+        cap.release()
+
+    if store.evicted:
+        return
+    if count > 0:
+        store.finish(count)
+    else:
+        frame_cache.remove(store)
+
+class MediaSource:
+    """One opened media file or webcam, its decoder and its playback clock.
+
+    Sources are shared between masks through the media registry; masks hold
+    Media handles instead of sources.
+    """
+
+    # Decode video files on a background thread unless told otherwise
+    threaded_decoding = True
+    # Keep a second capture parked at frame 0 so loops don't stall on a seek
+    gapless_loop = True
+    # Decode clips that fit the frame cache once, then play them from memory
+    cache_frames = True
+    # Shrink decoded frames to the largest size any mask shows them at
+    downscale_on_ingest = True
+    # Serve still images from a pyramid of halved copies, picked per mask
+    still_pyramid = True
+    # Keep stills this large as memory-mapped tiles, read only where masks sample them
+    tiled_images = True
+    tiled_min_pixels = 8192 * 8192
+    # Frame rate of image sequences that don't carry their own timing
+    default_sequence_fps = 24.0
+    # Opens webcams; swap in core.capture.FakeCapture to run without a camera
+    capture_factory = cv2.VideoCapture
+
+    def __init__(self, path, is_webcam=False, webcam_index=0,
+                 threaded=None, prefetch_depth=4, max_prefetch_bytes=256 * 1024 * 1024,
+                 gapless=None, cache_frames=None, capture_factory=None, proxy=None,
+                 sequence_fps=None, sequence_workers=None, rate=1.0, start_offset=0.0):
         self.is_webcam = is_webcam
         self.path = path if not is_webcam else f"webcam:{webcam_index}"
+        self.webcam_index = webcam_index
+        self.proxy_path = proxy  # File actually decoded, when playing from a proxy
+        self.key = MediaRegistry.get_key(path, is_webcam, webcam_index, proxy,
+                                         rate, start_offset, sequence_fps)
         self.is_video = False
         self.cap = None
+        self.reader = None
+        self.decoder = None
+        self.capture = None  # Webcam capture thread
+        self.store = None  # Decoded frames in the frame cache, once available
+        self._playing_from_store = False
+        self.last_frame = None
+
+        # Working size: decoded frames are resized to this when masks show them small
+        self.footprints = {}  # Media handle id -> output pixels per native pixel
+        self.working_size = None  # (w, h), or None for native size
+        self.pyramid = None  # Still images: [native, 1/2, 1/4, ...], built on demand
+        self.tiled = None  # Huge still images: TiledImage read per visible region
+        self._regions = {}  # Media handle id -> ((level, rect), frame, covered rect)
+        self.is_sequence = False
+        self.sequence = None  # Frame folders and animated images
+        self.sequence_decoder = None
+
+        # Playback: media time = (clock - start_time) * rate + start_offset
+        self.rate = rate
+        self.start_offset = start_offset  # Seconds into the clip at playback start
+        self.start_time = time.monotonic()
+        self.frame_index = 0  # Playback index of last_frame
+
+        # Stats
+        self.underruns = 0  # Render ticks where the frame for the clock wasn't ready
 
         if is_webcam:
             # Initialize webcam
-            self.cap = cv2.VideoCapture(webcam_index)
+            open_capture = capture_factory or type(self).capture_factory
+            self.cap = open_capture(webcam_index)
             if not self.cap.isOpened():
                 raise ValueError(f"Failed to open webcam {webcam_index}")
 
@@ -20,42 +306,616 @@ class Media:
                 self.original_frame = frame
                 self.height, self.width = frame.shape[:2]
             else:
+                self.cap.release()
                 raise ValueError("Failed to read from webcam")
+
+            if self.threaded_decoding if threaded is None else threaded:
+                # The capture thread owns the device from here on
+                self.capture = WebcamCapture(self.cap, lambda: open_capture(webcam_index), self.ingest)
+                self.capture.start()
+        elif is_sequence_path(path):
+            # Image sequences play like videos, decoded a frame per file
+            self.is_video = self.is_sequence = True
+            self.sequence = ImageSequence(path)
+            self.fps = sequence_fps or self.sequence.fps or self.default_sequence_fps
+            frame = self.sequence.read(0)
+            if frame is None:
+                raise ValueError("Failed to read the first frame of the sequence")
+            self.original_frame = frame
+            self.height, self.width = frame.shape[:2]
+            if not self.sequence.in_memory and (self.threaded_decoding if threaded is None else threaded):
+                decoder = SequenceDecoder(self.sequence, workers=sequence_workers, ingest=self.ingest)
+                # Enough frames in flight to keep every worker busy, bounded by memory
+                decoder.depth = max(1, min(max(prefetch_depth, 2 * decoder.workers),
+                                           max_prefetch_bytes // max(1, frame.nbytes)))
+                self.sequence_decoder = decoder
+            if probe_cache.get(path) is None:
+                probe_cache.record(path, frame, self.fps, self.sequence.frame_count,
+                                   duration=self.sequence.get_duration(self.fps))
         else:
             # File-based media
-            self.is_video = path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.webm'))
+            self.is_video = path.lower().endswith(VIDEO_EXTENSIONS)
 
             if self.is_video:
-                self.cap = cv2.VideoCapture(path)
-                self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+                video_path = proxy or path
+                self.cap = cv2.VideoCapture(video_path)
+                self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
                 ret, frame = self.cap.read()
                 if ret:
                     self.original_frame = frame
                     self.height, self.width = frame.shape[:2]
                 else:
                     raise ValueError("Failed to read video")
+                if proxy is not None:
+                    # Keep the original's size: media transforms are in native
+                    # pixels, and the renderer scales the smaller proxy frames up
+                    probe = probe_cache.probe(path, is_video=True)
+                    if probe is not None:
+                        self.width, self.height = probe["width"], probe["height"]
+
+                spare = None
+                if self.gapless_loop if gapless is None else gapless:
+                    spare = cv2.VideoCapture(video_path)
+                    if not spare.isOpened():
+                        spare = None
+                self.reader = VideoReader(self.cap, self.fps, position=1, spare=spare)
+                if self.threaded_decoding if threaded is None else threaded:
+                    # Bound the queue by both frame count and memory
+                    depth = max(1, min(prefetch_depth, max_prefetch_bytes // max(1, frame.nbytes)))
+                    self.decoder = FrameDecoder(self.reader, depth, self.ingest)
+                    self.decoder.start()
+                if self.cache_frames if cache_frames is None else cache_frames:
+                    self._open_frame_store(video_path, frame.shape)
+                if proxy is None and probe_cache.get(path) is None:
+                    probe_cache.record(path, frame, self.fps, self.reader.frame_count)
             else:
-                self.original_frame = cv2.imread(path)
-                if self.original_frame is None:
-                    raise ValueError("Failed to load image")
-                self.height, self.width = self.original_frame.shape[:2]
-
-    def get_current_frame(self):
-        if self.is_webcam and self.cap:
-            # For webcam, always get the latest frame
-            ret, frame = self.cap.read()
-            if ret:
-                return frame
+                self.tiled = TiledImage.open(path) if self.tiled_images else None
+                if self.tiled is None:
+                    # Shared, read-only decode; copies of the same file share it too.
+                    # Images big enough to tile stay out of the cache, so they
+                    # don't evict every other still on their way to the tile set
+                    max_pixels = self.tiled_min_pixels - 1 if self.tiled_images else None
+                    image = image_cache.get(path, max_pixels)
+                    if image is None:
+                        raise ValueError("Failed to load image")
+                    if self.tiled_images and image.shape[0] * image.shape[1] >= self.tiled_min_pixels:
+                        try:
+                            self.tiled = TiledImage.build(path, image)
+                        except OSError as e:
+                            print(f"Warning: Could not tile {path}, keeping it in memory: {e}")
+                if self.tiled is not None:
+                    self.width, self.height = self.tiled.width, self.tiled.height
+                    # Whole-image fallback for consumers that don't ask for a region
+                    self.original_frame = self.tiled.get_overview()
+                else:
+                    self.original_frame = image
+                    self.height, self.width = image.shape[:2]
+                if probe_cache.get(path) is None:
+                    probe_cache.record(path, self.original_frame, dimensions=(self.width, self.height))
+
+        self.last_frame = self.original_frame
+
+    def _open_frame_store(self, path, shape):
+        """Use the clip's cached frames, decoding them in the background on first open"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        key = (os.path.normcase(os.path.abspath(path)), stat.st_size, stat.st_mtime_ns)
+        store = frame_cache.get(key)
+        if store is None:
+            if not self.reader.frame_count:
+                return
+            store = frame_cache.allocate(key, shape, self.reader.frame_count)
+            if store is None:
+                return
+            store.filler = threading.Thread(target=fill_frame_store, args=(store, path),
+                                            name="media-cache", daemon=True)
+            store.filler.start()
+        self.store = store
+
+    def set_footprint(self, owner, scale):
+        """Record how many output pixels per native pixel a consumer needs"""
+        if self.footprints.get(owner) != scale:
+            self.footprints[owner] = scale
+            self._update_working_size()
+
+    def drop_footprint(self, owner):
+        self._regions.pop(owner, None)
+        if self.footprints.pop(owner, None) is not None:
+            self._update_working_size()
+
+    def _update_working_size(self):
+        scales = list(self.footprints.values())
+        if not self.downscale_on_ingest or not (self.reader or self.sequence or self.is_webcam) or not scales:
+            self.working_size = None
+            return
+        # Round up to steps of sqrt(2) so small changes (dragging a corner) keep the size
+        scale = 2 ** (np.ceil(np.log2(max(max(scales), 1e-6)) * 2) / 2)
+        w, h = round(self.width * scale), round(self.height * scale)
+        if scale >= 1 or w < 16 or h < 16:
+            self.working_size = None
+        else:
+            self.working_size = (w, h)
+
+    def ingest(self, frame):
+        """Resize a freshly decoded frame to the working size"""
+        size = self.working_size
+        if size is None or frame.shape[1] <= size[0]:
+            # Already at the working size, or smaller (e.g. a proxy); never upscale
+            return frame
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def get_pyramid_level(self, scale):
+        """Smallest pyramid level of a still image that is still at least scale times native size"""
+        if self.pyramid is None:
+            self.pyramid = [self.original_frame]
+        index = 0
+        while True:
+            h, w = self.pyramid[index].shape[:2]
+            next_w, next_h = (w + 1) // 2, (h + 1) // 2
+            if next_w < scale * self.width or next_h < scale * self.height or min(next_w, next_h) < 16:
+                return self.pyramid[index]
+            index += 1
+            if index == len(self.pyramid):
+                # Halving with INTER_AREA keeps cv2.resize's pixel-center
+                # alignment, which the renderer's working -> native scale assumes
+                self.pyramid.append(cv2.resize(self.pyramid[-1], (next_w, next_h),
+                                               interpolation=cv2.INTER_AREA))
+
+    @property
+    def is_tiled(self):
+        return self.tiled is not None
+
+    def get_region(self, rect, owner=None):
+        """Pixels of a tiled still covering native rect (x0, y0, x1, y1).
+
+        Read at the level fitting owner's footprint; returns (frame, covered)
+        where covered is the native rectangle the frame spans. Each owner's
+        last region is kept, so unchanged masks don't read tiles again.
+        """
+        level = self.tiled.pick_level(self.footprints.get(owner, 1.0))
+        cached = self._regions.get(owner)
+        if cached is not None and cached[0] == (level, rect):
+            return cached[1], cached[2]
+        frame, covered = self.tiled.read(level, rect)
+        self._regions[owner] = ((level, rect), frame, covered)
+        return frame, covered
+
+    def restart(self):
+        """Restart playback from start_offset"""
+        self.start_time = time.monotonic()
+
+    def get_frame_index(self, now=None):
+        """Playback frame index at playback time now (seconds since start; default: the clock)"""
+        if now is None:
+            now = time.monotonic() - self.start_time
+        if self.sequence:
+            return self.sequence.get_index(max(0.0, now * self.rate + self.start_offset), self.fps)
+        # Small epsilon so e.g. frame 3 of a 30 fps export lands on frame 3, not 2.9999
+        return max(0, int((now * self.rate + self.start_offset) * self.fps + 1e-6))
+
+    def get_duration(self):
+        """Length of one loop in seconds at rate 1, or 0 if unknown (stills, webcams)"""
+        if self.sequence:
+            return self.sequence.get_duration(self.fps)
+        if self.reader and self.reader.frame_count:
+            return self.reader.frame_count / self.fps
+        return 0.0
+
+    def get_current_frame(self, now=None, block=False, owner=None):
+        """Return the frame for playback time now (see get_frame_index).
+
+        Videos skip frames when behind and repeat the last one when ahead of the
+        clock; webcams return their newest captured frame (or, without a capture
+        thread, are read at most once per frame interval). With
+        block=False a threaded decoder never stalls the caller. Still images
+        come from the pyramid level fitting owner's footprint.
+        """
+        if self.capture:
+            # Newest captured frame, if one arrived since the last call
+            frame = self.capture.take()
+            if frame is not None:
+                self.last_frame = frame
+            return self.last_frame
+
+        if self.sequence:
+            target = self.get_frame_index(now)
+            if target == self.frame_index:
+                return self.last_frame
+            if self.sequence_decoder:
+                frame = self.sequence_decoder.take(target, block)
+            else:
+                frame = self.sequence.read(target % self.sequence.frame_count)
+                frame = self.ingest(frame) if frame is not None else None
+            if frame is None:
+                self.underruns += 1
+            else:
+                self.frame_index, self.last_frame = target, frame
+            return self.last_frame
+
+        if not self.cap:
+            if self.still_pyramid and owner in self.footprints:
+                return self.get_pyramid_level(self.footprints[owner])
             return self.original_frame
-        elif self.is_video and self.cap:
-            # For video files, loop playback
+
+        # Every consumer asking within the same frame interval gets the same frame
+        target = self.get_frame_index(now)
+        if target == self.frame_index:
+            return self.last_frame
+
+        if self.is_webcam:
             ret, frame = self.cap.read()
-            if not ret:
-                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                ret, frame = self.cap.read()
-            return frame if ret else self.original_frame
-        return self.original_frame
+            if ret:
+                self.frame_index, self.last_frame = target, self.ingest(frame)
+            return self.last_frame
+
+        store = self.store
+        if store is not None:
+            if store.ready:
+                # Stored frames are native size; shrink them like decoded ones,
+                # once per frame since every consumer shares last_frame
+                frame_cache.touch(store)
+                self.frame_index, self.last_frame = target, self.ingest(store.get(target))
+                self._playing_from_store = True
+                return self.last_frame
+            if store.evicted:
+                self.store = None
+
+        if self._playing_from_store:
+            # The cache was evicted under us; resume decoding at the clock
+            self._playing_from_store = False
+            if self.decoder:
+                self.decoder.seek(target)
+                self.frame_index = -1
+
+        if self.decoder:
+            if target < self.frame_index:
+                # Jumped backwards (restart, export, rate change); last_frame
+                # no longer belongs to the timeline until the decoder catches up
+                self.decoder.seek(target)
+                self.frame_index = -1
+            entry = self.decoder.take(target, block)
+            if entry is not None:
+                self.frame_index, self.last_frame = entry
+            if self.frame_index != target:
+                self.underruns += 1
+        else:
+            frame = self.reader.read(target)
+            if frame is not None:
+                self.frame_index, self.last_frame = target, self.ingest(frame)
+
+        return self.last_frame
+
+    def get_stats(self):
+        stats = {"underruns": self.underruns, "frame_index": self.frame_index}
+        if self.reader:
+            stats["loops"] = self.reader.loops
+            stats["seeks"] = self.reader.seeks
+        if self.store:
+            stats["cached"] = self.store.ready
+            stats["cache_on_disk"] = self.store.on_disk
+        if self.working_size:
+            stats["working_size"] = self.working_size
+        if self.pyramid:
+            stats["pyramid_levels"] = len(self.pyramid)
+        if self.tiled:
+            stats.update(self.tiled.get_stats())
+        if self.capture:
+            stats.update(self.capture.get_stats())
+        if self.decoder:
+            stats["frames_decoded"] = self.decoder.frames_decoded
+            stats["queued_frames"] = len(self.decoder.frames)
+            stats["prefetch_depth"] = self.decoder.depth
+        if self.sequence_decoder:
+            stats["frames_decoded"] = self.sequence_decoder.frames_decoded
+            stats["queued_frames"] = len(self.sequence_decoder.frames)
+            stats["prefetch_depth"] = self.sequence_decoder.depth
+            stats["decode_workers"] = self.sequence_decoder.workers
+        return stats
 
     def release(self):
-        if self.cap:
+        if self.decoder:
+            self.decoder.stop()
+            self.decoder = None
+        if self.sequence_decoder:
+            self.sequence_decoder.release()
+            self.sequence_decoder = None
+        if self.capture:
+            # The capture thread releases the device it holds
+            self.capture.stop()
+            self.capture = None
+        elif self.reader:
+            # The reader owns the capture and its spare
+            self.reader.release()
+        elif self.cap:
             self.cap.release()
+
+class MediaRegistry:
+    """Shares one MediaSource between every mask showing the same file or webcam.
+
+    Videos and sequences are only shared between masks on the same clock
+    (rate, start offset and sequence frame rate), since a source has one
+    playhead; stills and webcams have no clock and are always shared.
+    """
+
+    def __init__(self):
+        self._sources = {}  # key -> MediaSource
+        self._refcounts = {}  # key -> number of Media handles
+        self._opening = {}  # key -> Event set once an in-progress open finishes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(path, is_webcam=False, webcam_index=0, proxy=None,
+                rate=1.0, start_offset=0.0, sequence_fps=None):
+        if is_webcam:
+            return ("webcam", webcam_index)
+        key = ("file", os.path.normcase(os.path.abspath(proxy or path)))
+        if path.lower().endswith(VIDEO_EXTENSIONS) or is_sequence_path(path):
+            if os.path.isdir(path):
+                # Only frame folders play at a chosen rate
+                sequence_fps = sequence_fps or MediaSource.default_sequence_fps
+            else:
+                sequence_fps = None
+            key += (float(rate), float(start_offset), sequence_fps)
+        return key
+
+    @classmethod
+    def get_options_key(cls, path, is_webcam, webcam_index, options):
+        """Key of the source that MediaSource options (proxy, clock, ...) would open"""
+        return cls.get_key(path, is_webcam, webcam_index, options.get("proxy"),
+                           options.get("rate", 1.0), options.get("start_offset", 0.0),
+                           options.get("sequence_fps"))
+
+    def acquire(self, path, is_webcam=False, webcam_index=0, **options):
+        """Return the shared source for path and clock options, opening it on first use"""
+        key = self.get_options_key(path, is_webcam, webcam_index, options)
+        while True:
+            with self._lock:
+                source = self._sources.get(key)
+                if source is not None:
+                    self._refcounts[key] += 1
+                    return source
+                opening = self._opening.get(key)
+                if opening is None:
+                    opening = self._opening[key] = threading.Event()
+                    break
+            # Another thread is opening the same media; share its result
+            opening.wait()
+
+        # Open outside the lock; a slow file shouldn't block other media
+        try:
+            source = MediaSource(path, is_webcam, webcam_index, **options)
+        except Exception:
+            with self._lock:
+                del self._opening[key]
+            opening.set()
+            raise
+
+        with self._lock:
+            del self._opening[key]
+            self._sources[key] = source
+            self._refcounts[key] = 1
+        opening.set()
+        return source
+
+    def release(self, source):
+        """Drop one reference to source, closing it when no handle uses it anymore"""
+        with self._lock:
+            key = source.key
+            if self._sources.get(key) is not source:
+                return
+            self._refcounts[key] -= 1
+            if self._refcounts[key] > 0:
+                return
+            del self._sources[key]
+            del self._refcounts[key]
+        source.release()
+
+    def get_refcount(self, source):
+        with self._lock:
+            return self._refcounts.get(source.key, 0) if self._sources.get(source.key) is source else 0
+
+    def get_stats(self):
+        with self._lock:
+            return {"sources": len(self._sources), "handles": sum(self._refcounts.values())}
+
+media_registry = MediaRegistry()
+
+class Media:
+    """A mask's handle on a shared MediaSource.
+
+    Creating a Media for a path that is already open on the same clock
+    reuses its decoder, so every mask showing the same clip at the same
+    rate and offset gets the same decoded frame each tick. Attributes not
+    defined here (path, width, fps, cap, ...) come from the source.
+    Changing a handle's rate, offset or sequence frame rate moves it to a
+    source on the new clock, leaving other masks alone. With proxies
+    enabled (or use_proxy=True), videos play from their proxy once it has
+    been transcoded.
+    """
+
+    ready = True  # Always opened; see PendingMedia
+
+    def __init__(self, path, is_webcam=False, webcam_index=0, use_proxy=None, **options):
+        if not is_webcam and path.lower().endswith(VIDEO_EXTENSIONS) and \
+                (proxy_cache.enabled if use_proxy is None else use_proxy):
+            # Play from the proxy if it's ready, otherwise start making one
+            options["proxy"] = proxy_cache.get_proxy(path)
+            if options["proxy"] is None:
+                proxy_cache.request(path)
+        self.source = media_registry.acquire(path, is_webcam, webcam_index, **options)
+        self.released = False
+        self._options = options  # Reused when the clock changes and the handle moves
+
+    def __getattr__(self, name):
+        if name == "source":
+            raise AttributeError(name)
+        return getattr(self.source, name)
+
+    @property
+    def rate(self):
+        return self.source.rate
+
+    @rate.setter
+    def rate(self, value):
+        self.set_clock(rate=value)
+
+    @property
+    def start_offset(self):
+        return self.source.start_offset
+
+    @start_offset.setter
+    def start_offset(self, value):
+        self.set_clock(start_offset=value)
+
+    def set_sequence_fps(self, fps):
+        """Play a frame folder at fps (animations keep their own timing)"""
+        if self.is_sequence and os.path.isdir(self.path):
+            self.set_clock(sequence_fps=fps)
+
+    def set_clock(self, rate=None, start_offset=None, sequence_fps=None):
+        """Change this mask's playback clock; other masks on the same file keep theirs.
+
+        Moves the handle to the source playing on the new clock, opening one
+        if no other mask uses it. Call with the render thread paused.
+        """
+        source = self.source
+        clock = {
+            "rate": source.rate if rate is None else rate,
+            "start_offset": source.start_offset if start_offset is None else start_offset,
+            "sequence_fps": source.fps if source.is_sequence and sequence_fps is None else sequence_fps,
+        }
+        options = dict(self._options, proxy=source.proxy_path, **clock)
+        if MediaRegistry.get_options_key(self.path, self.is_webcam, self.webcam_index, options) == source.key:
+            # Same source (stills and webcams have no clock to move between)
+            source.rate, source.start_offset = clock["rate"], clock["start_offset"]
+            return
+
+        new_source = media_registry.acquire(self.path, self.is_webcam, self.webcam_index, **options)
+        if media_registry.get_refcount(new_source) == 1:
+            # A fresh clock continues this mask's phase rather than restarting
+            new_source.start_time = source.start_time
+        self.source = new_source
+        self._options = options
+        source.drop_footprint(id(self))
+        media_registry.release(source)
+
+    def reopen(self, **options):
+        """Open this media again (e.g. to switch between proxy and original), keeping its clock"""
+        options = dict(options, rate=self.rate, start_offset=self.start_offset)
+        if self.is_sequence:
+            options["sequence_fps"] = self.fps
+        media = Media(self.path, self.is_webcam, self.webcam_index, **options)
+        if media_registry.get_refcount(media.source) == 1:
+            media.source.start_time = self.source.start_time
+        return media
+
+    def set_footprint(self, scale):
+        """Called by the renderer with the output pixels per media pixel this mask needs"""
+        self.source.set_footprint(id(self), scale)
+
+    def get_current_frame(self, now=None, block=False):
+        return self.source.get_current_frame(now, block, id(self))
+
+    def get_region(self, rect):
+        """Region of a tiled still sampled by this mask; see MediaSource.get_region"""
+        return self.source.get_region(rect, id(self))
+
+    def get_stats(self):
+        stats = self.source.get_stats()
+        stats["handles"] = media_registry.get_refcount(self.source)
+        return stats
+
+    def release(self):
+        """Release this handle; the source closes when its last handle is released"""
+        if not self.released:
+            self.released = True
+            self.source.drop_footprint(id(self))
+            media_registry.release(self.source)
+
+class PendingMedia:
+    """Placeholder for a mask's media while it is opened in the background.
+
+    Carries what a project file stores about the media, so the mask can be
+    saved, edited and rendered before the media is ready. If the file has
+    been probed before, its size, timing and poster frame come from the
+    probe cache and the mask shows the poster meanwhile.
+    """
+
+    ready = False
+    cap = None
+    is_tiled = False
+
+    def __init__(self, path, is_webcam=False, webcam_index=0):
+        self.is_webcam = is_webcam
+        self.webcam_index = webcam_index
+        self.path = path if not is_webcam else f"webcam:{webcam_index}"
+        self.is_sequence = not is_webcam and is_sequence_path(path)
+        self.is_video = self.is_sequence or (not is_webcam and path.lower().endswith(VIDEO_EXTENSIONS))
+        self.sequence_fps = None  # Frame folder rate to open with; None uses the default
+        self.rate = 1.0
+        self.start_offset = 0.0
+        self.released = False
+
+        # Known without opening the file when it's in the probe cache
+        self.width = self.height = None
+        self.fps = 0.0
+        self.frame_count = 0
+        self.duration = 0.0
+        self.poster = None
+        probe = probe_cache.get(path) if not is_webcam else None
+        if probe is not None:
+            self.width, self.height = probe["width"], probe["height"]
+            self.fps = probe["fps"]
+            self.frame_count = probe["frame_count"]
+            self.duration = probe["duration"]
+            self.poster = probe_cache.load_poster(probe)
+        if self.is_sequence and os.path.isdir(path):
+            self.fps = MediaSource.default_sequence_fps
+
+    @classmethod
+    def from_media(cls, media):
+        """Placeholder that reopens media (a Media or PendingMedia) with the same settings"""
+        pending = cls(media.path, media.is_webcam, media.webcam_index)
+        pending.rate = media.rate
+        pending.start_offset = media.start_offset
+        if media.is_sequence:
+            pending.set_sequence_fps(media.fps)
+        return pending
+
+    def open(self):
+        """Open the real media; blocking, so call it off the GUI thread"""
+        clock = {"rate": self.rate, "start_offset": self.start_offset}
+        if self.is_webcam:
+            return Media(path="", is_webcam=True, webcam_index=self.webcam_index, **clock)
+        if self.is_sequence:
+            clock["sequence_fps"] = self.sequence_fps
+        return Media(self.path, **clock)
+
+    def get_current_frame(self, now=None, block=False):
+        return self.poster
+
+    def set_sequence_fps(self, fps):
+        """Open a frame folder at fps (animations keep their own timing)"""
+        if self.is_sequence and os.path.isdir(self.path):
+            self.sequence_fps = self.fps = fps
+
+    def get_duration(self):
+        """Probed length of one loop in seconds, or 0 if unknown"""
+        if self.is_sequence and os.path.isdir(self.path) and self.frame_count:
+            return self.frame_count / self.fps
+        return self.duration
+
+    def set_footprint(self, scale):
+        pass
+
+    def restart(self):
+        pass
+
+    def get_stats(self):
+        return {"pending": True, "poster": self.poster is not None}
+
+    def release(self):
+        """Cancel: the media is released as soon as it finishes opening"""
+        self.released = True
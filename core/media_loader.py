@@ -0,0 +1,82 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, QCoreApplication, pyqtSignal
+
+
+class MediaLoader(QObject):
+    """Opens masks' media on a worker pool and attaches each one when it's ready.
+
+    load() gives the mask a PendingMedia placeholder immediately; the real
+    Media replaces it on the GUI thread once opened. Opening (VideoCapture,
+    first frame decode, imread) runs in parallel, off the GUI thread.
+    """
+
+    media_ready = pyqtSignal(object, object)  # (mask, media)
+    media_failed = pyqtSignal(object, str)  # (mask, error message)
+    progress = pyqtSignal(int, int)  # (opened so far, total in this batch)
+    finished = pyqtSignal()
+
+    # Emitted from worker threads, delivered on the GUI thread
+    _opened = pyqtSignal(object, object, object, object)  # (mask, pending, media, error)
+
+    def __init__(self, max_workers=None, parent=None):
+        super().__init__(parent)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or min(8, (os.cpu_count() or 1) * 2),
+                                            thread_name_prefix="media-open")
+        self._opened.connect(self._attach)
+        self._closing = False
+
+        # Progress of the current batch; resets when everything queued is done
+        self.total = 0
+        self.done = 0
+
+    def load(self, mask, pending):
+        """Show pending on the mask now and open the real media in the background"""
+        mask.media = pending
+        self.total += 1
+        self.progress.emit(self.done, self.total)
+        self._executor.submit(self._open, mask, pending)
+
+    def is_busy(self):
+        return self.done < self.total
+
+    def _open(self, mask, pending):
+        media, error = None, None
+        try:
+            media = pending.open()
+        except Exception as e:
+            error = e
+        if self._closing and media is not None:
+            # The app is shutting down; nobody will attach this
+            media.release()
+            return
+        self._opened.emit(mask, pending, media, error)
+
+    def _attach(self, mask, pending, media, error):
+        self.done += 1
+        if error is not None:
+            print(f"Warning: Could not load media from {pending.path}: {error}")
+            if mask.media is pending:
+                mask.media = None
+            self.media_failed.emit(mask, str(error))
+        elif self._closing or pending.released or mask.media is not pending:
+            # The mask was deleted, its project closed, or its media replaced meanwhile
+            media.release()
+        else:
+            # Playback settings may have been edited while it was opening
+            media.set_clock(pending.rate, pending.start_offset,
+                            pending.sequence_fps if pending.is_sequence else None)
+            mask.media = media
+            self.media_ready.emit(mask, media)
+
+        self.progress.emit(self.done, self.total)
+        if self.done >= self.total:
+            self.total = self.done = 0
+            self.finished.emit()
+
+    def shutdown(self):
+        """Stop opening media; anything that finishes opening afterwards is released"""
+        self._closing = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        # Deliver results still queued for the GUI thread, releasing their media
+        QCoreApplication.sendPostedEvents(self)
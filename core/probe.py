@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import threading
+import cv2
+
+
+class ProbeCache:
+    """Media metadata (size, fps, frame count, duration) and poster frames, kept on disk.
+
+    Entries are keyed by path and invalidated when the file's size or
+    modification time changes. Media record themselves here when they're
+    opened, so later project loads and dialogs can read metadata and show a
+    poster without opening or decoding the file.
+    """
+
+    def __init__(self, directory=None, poster_size=256, max_entries=2000):
+        self.directory = directory or os.path.join(os.path.expanduser("~"), ".cache", "badmapper", "probes")
+        self.poster_size = poster_size  # Longest side of poster frames, in pixels
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = None  # Absolute path -> entry dict, loaded on first use
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, "probes.json")
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        try:
+            with open(self.index_path, "r") as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read probe cache: {e}")
+
+    def _save(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            partial = self.index_path + ".partial"
+            with open(partial, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(partial, self.index_path)
+        except OSError as e:
+            print(f"Warning: Could not save probe cache: {e}")
+
+    @staticmethod
+    def _file_id(path):
+        stat = os.stat(path)
+        return os.path.normcase(os.path.abspath(path)), stat.st_size, stat.st_mtime_ns
+
+    def get(self, path):
+        """Cached probe of path, or None if it hasn't been probed since it last changed"""
+        try:
+            name, size, mtime = self._file_id(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._load()
+            entry = self._entries.get(name)
+            if entry is None or entry["size"] != size or entry["mtime"] != mtime:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(entry)
+
+    def probe(self, path, is_video):
+        """Probe of path, opening the file to fill the cache on a miss; None if unreadable"""
+        entry = self.get(path)
+        if entry is not None:
+            return entry
+
+        if is_video:
+            cap = cv2.VideoCapture(path)
+            try:
+                ret, frame = cap.read()
+                if not ret:
+                    return None
+                return self.record(path, frame, cap.get(cv2.CAP_PROP_FPS),
+                                   cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            finally:
+                cap.release()
+
+        image = cv2.imread(path)
+        if image is None:
+            return None
+        return self.record(path, image)
+
+    def record(self, path, frame, fps=0.0, frame_count=1, dimensions=None, duration=None):
+        """Store what an opened file revealed about itself.
+
+        frame is its first frame; pass the native (w, h) as dimensions when frame
+        is a reduced copy, and duration when it isn't frame_count / fps.
+        """
+        try:
+            name, size, mtime = self._file_id(path)
+        except OSError:
+            return None
+        fps = fps if fps and fps > 0 else 0.0
+        frame_count = int(frame_count) if frame_count and frame_count > 0 else 0
+        width, height = dimensions or (frame.shape[1], frame.shape[0])
+        entry = {
+            "size": size,
+            "mtime": mtime,
+            "width": width,
+            "height": height,
+            "fps": fps,
+            "frame_count": frame_count,
+            "duration": duration if duration is not None else frame_count / fps if fps else 0.0,
+            "poster": self._write_poster(name, size, mtime, frame),
+        }
+        with self._lock:
+            self._load()
+            stale = self._entries.pop(name, None)
+            if stale is not None and stale.get("poster") != entry["poster"]:
+                self._remove_poster(stale)
+            self._entries[name] = entry  # Newest last, so trimming drops the oldest
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove_poster(self._entries.pop(oldest))
+            self._save()
+        return dict(entry)
+
+    def _write_poster(self, name, size, mtime, frame):
+        poster_name = hashlib.sha1(f"{name}|{size}|{mtime}".encode()).hexdigest() + ".jpg"
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.poster_size / max(width, height))
+        if scale < 1.0:
+            frame = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if cv2.imwrite(os.path.join(self.directory, poster_name), frame):
+                return poster_name
+        except (OSError, cv2.error) as e:
+            print(f"Warning: Could not save poster frame: {e}")
+        return None
+
+    def _remove_poster(self, entry):
+        if entry.get("poster"):
+            try:
+                os.remove(os.path.join(self.directory, entry["poster"]))
+            except OSError:
+                pass
+
+    def load_poster(self, entry):
+        """Poster frame of a probe entry as a BGR image, or None"""
+        if not entry or not entry.get("poster"):
+            return None
+        return cv2.imread(os.path.join(self.directory, entry["poster"]))
+
+    def clear(self):
+        with self._lock:
+            self._load()
+            for entry in self._entries.values():
+                self._remove_poster(entry)
+            self._entries = {}
+            self._save()
+
+    def get_stats(self):
+        with self._lock:
+            entries = len(self._entries) if self._entries is not None else 0
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+
+probe_cache = ProbeCache()
@@ -1,9 +1,12 @@
 import json
 import os
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
 import numpy as np
 from core.mask import Mask, MaskType, MediaTransform
-from core.media import Media
+from core.media import PendingMedia
+
+if TYPE_CHECKING:
+    from core.media_loader import MediaLoader
 
 
 class ProjectSerializer:
@@ -52,12 +55,14 @@ class ProjectSerializer:
             return False
 
     @staticmethod
-    def load_project(file_path: str) -> Dict[str, Any]:
+    def load_project(file_path: str, media_loader: Optional["MediaLoader"] = None) -> Dict[str, Any]:
         """
         Load project from a .bad file
 
         Args:
             file_path: Path to the .bad file
+            media_loader: If given, media is opened in the background by this
+                MediaLoader and masks start out with PendingMedia placeholders
 
         Returns:
             Dictionary with 'masks', 'projection_width', and 'projection_height'
@@ -72,7 +77,7 @@ class ProjectSerializer:
 
             masks = []
             for mask_data in project_data.get("masks", []):
-                mask = ProjectSerializer._deserialize_mask(mask_data)
+                mask = ProjectSerializer._deserialize_mask(mask_data, media_loader)
                 if mask:
                     masks.append(mask)
 
@@ -118,7 +123,9 @@ class ProjectSerializer:
             media_dict = {
                 "path": mask.media.path,
                 "is_video": mask.media.is_video,
-                "is_webcam": mask.media.is_webcam
+                "is_webcam": mask.media.is_webcam,
+                "playback_rate": mask.media.rate,
+                "start_offset": mask.media.start_offset
             }
             # Extract webcam index if it's a webcam
             if mask.media.is_webcam and mask.media.path.startswith("webcam:"):
@@ -127,12 +134,15 @@ class ProjectSerializer:
                     media_dict["webcam_index"] = webcam_index
                 except:
                     media_dict["webcam_index"] = 0
+            # Frame folders play at a chosen rate
+            if mask.media.is_sequence:
+                media_dict["fps"] = mask.media.fps
             mask_data["media"] = media_dict
 
         return mask_data
 
     @staticmethod
-    def _deserialize_mask(mask_data: Dict[str, Any]) -> Mask:
+    def _deserialize_mask(mask_data: Dict[str, Any], media_loader: Optional["MediaLoader"] = None) -> Mask:
         """Deserialize a mask from a dictionary"""
         try:
             # Parse mask type
@@ -176,27 +186,30 @@ class ProjectSerializer:
             media_data = mask_data.get("media")
             if media_data:
                 is_webcam = media_data.get("is_webcam", False)
+                media_path = media_data.get("path")
 
                 if is_webcam:
-                    # Restore webcam
-                    webcam_index = media_data.get("webcam_index", 0)
-                    try:
-                        mask.media = Media(path="", is_webcam=True, webcam_index=webcam_index)
-                    except Exception as e:
-                        print(f"Warning: Could not open webcam {webcam_index}: {e}")
-                        mask.media = None
+                    pending = PendingMedia("", is_webcam=True, webcam_index=media_data.get("webcam_index", 0))
+                elif media_path and os.path.exists(media_path):
+                    pending = PendingMedia(media_path)
                 else:
-                    # Restore file-based media
-                    media_path = media_data.get("path")
-                    if media_path and os.path.exists(media_path):
+                    print(f"Warning: Media file not found: {media_path}")
+                    pending = None
+
+                if pending:
+                    pending.rate = media_data.get("playback_rate", 1.0)
+                    pending.start_offset = media_data.get("start_offset", 0.0)
+                    if "fps" in media_data:
+                        pending.set_sequence_fps(media_data["fps"])
+
+                    if media_loader:
+                        media_loader.load(mask, pending)
+                    else:
                         try:
-                            mask.media = Media(media_path)
+                            mask.media = pending.open()
                         except Exception as e:
-                            print(f"Warning: Could not load media from {media_path}: {e}")
+                            print(f"Warning: Could not load media from {pending.path}: {e}")
                             mask.media = None
-                    else:
-                        print(f"Warning: Media file not found: {media_path}")
-                        mask.media = None
 
             return mask
         except Exception as e:
@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from core.content_key import content_keys
+
+
+class ProxyCache:
+    """Intra-frame (MJPG) proxies of source videos, transcoded in the background.
+
+    Proxies are named after a hash of the source's content, so renamed or
+    copied files share one proxy and an edited file gets a new one. Every
+    proxy frame is a keyframe, so seeks and loops are cheap; proxies taller
+    than max_height are also downscaled.
+
+    Hashing reads the whole source, so it only happens on the worker. Lookups
+    from the GUI thread use keys already worked out, kept in an index by
+    path, size and modification time so they last across runs.
+    """
+
+    def __init__(self, directory=None, max_height=1080, quality=90):
+        self.directory = directory or os.path.join(os.path.expanduser("~"), ".cache", "badmapper", "proxies")
+        self.max_height = max_height
+        self.quality = quality
+        self.max_index_entries = 2000  # Oldest index entries are dropped past this
+        self.enabled = False  # Play videos from their proxies when available
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="proxy")
+        self._lock = threading.Lock()
+        self._jobs = {}  # Source path -> Future of an in-progress hash and transcode
+        self._index = None  # Source path -> {"size", "mtime", "key"}, loaded on first use
+        self._closing = False
+        self.callbacks = []  # Called with the source path when its proxy is ready, from a worker thread
+
+        # Stats
+        self.transcoded = 0
+        self.failed = 0
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, "index.json")
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        try:
+            with open(self.index_path, "r") as f:
+                self._index = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read proxy index: {e}")
+
+    def _save_index(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            partial = self.index_path + ".partial"
+            with open(partial, "w") as f:
+                json.dump(self._index, f)
+            os.replace(partial, self.index_path)
+        except OSError as e:
+            print(f"Warning: Could not save proxy index: {e}")
+
+    @staticmethod
+    def _file_id(path):
+        stat = os.stat(path)
+        return os.path.normcase(os.path.abspath(path)), stat.st_size, stat.st_mtime_ns
+
+    def get_key(self, path):
+        """Content key naming path's proxy, reading the whole file if it isn't known yet.
+
+        Raises OSError if it can't be read. Slow for big files; call it off the GUI thread.
+        """
+        key = content_keys.get(path)
+        name, size, mtime = self._file_id(path)
+        with self._lock:
+            self._load_index()
+            entry = self._index.get(name)
+            if entry != {"size": size, "mtime": mtime, "key": key}:
+                self._index.pop(name, None)
+                self._index[name] = {"size": size, "mtime": mtime, "key": key}
+                while len(self._index) > self.max_index_entries:
+                    del self._index[next(iter(self._index))]
+                self._save_index()
+        return key
+
+    def get_known_key(self, path):
+        """Content key of path if it has been hashed before (this run or an earlier one), else None"""
+        key = content_keys.peek(path)
+        if key is not None:
+            return key
+        try:
+            name, size, mtime = self._file_id(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._load_index()
+            entry = self._index.get(name)
+        if entry is None or entry["size"] != size or entry["mtime"] != mtime:
+            return None
+        return entry["key"]
+
+    def get_proxy_path(self, key):
+        return os.path.join(self.directory, key + ".avi")
+
+    def get_proxy(self, path):
+        """Path of the finished proxy for path, or None (also while path hasn't been hashed yet)"""
+        key = self.get_known_key(path)
+        if key is None:
+            return None
+        proxy = self.get_proxy_path(key)
+        return proxy if os.path.exists(proxy) else None
+
+    def is_pending(self, path):
+        with self._lock:
+            return os.path.normcase(os.path.abspath(path)) in self._jobs
+
+    def request(self, path):
+        """Find or make path's proxy in the background unless it's known to exist or in progress.
+
+        Callbacks are called once it's ready, even if it turns out to exist already.
+        """
+        if self.get_proxy(path) is not None:
+            return
+        name = os.path.normcase(os.path.abspath(path))
+        with self._lock:
+            if self._closing or name in self._jobs:
+                return
+            self._jobs[name] = self._executor.submit(self._make_proxy, path, name)
+
+    def _make_proxy(self, path, name):
+        try:
+            try:
+                key = self.get_key(path)
+            except OSError as e:
+                print(f"Warning: Could not read {path} to make its proxy: {e}")
+                self.failed += 1
+                return
+            if not os.path.exists(self.get_proxy_path(key)) and not self._transcode(path, key):
+                return
+        finally:
+            with self._lock:
+                self._jobs.pop(name, None)
+
+        for callback in list(self.callbacks):
+            try:
+                callback(path)
+            except Exception as e:
+                print(f"Proxy callback error: {e}")
+
+    def _transcode(self, path, key):
+        """Write key's proxy from path; True once it's in place"""
+        proxy = self.get_proxy_path(key)
+        partial = os.path.join(self.directory, key + ".partial.avi")
+        cap = cv2.VideoCapture(path)
+        writer = None
+        written = 0
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            while not self._closing:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if writer is None:
+                    h, w = frame.shape[:2]
+                    scale = min(1.0, self.max_height / h)
+                    size = (max(2, int(w * scale) // 2 * 2), max(2, int(h * scale) // 2 * 2))
+                    writer = cv2.VideoWriter(partial, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+                    writer.set(cv2.VIDEOWRITER_PROP_QUALITY, self.quality)
+                if (frame.shape[1], frame.shape[0]) != size:
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                writer.write(frame)
+                written += 1
+        except Exception as e:
+            print(f"Warning: Could not create proxy for {path}: {e}")
+            written = 0
+        finally:
+            cap.release()
+            if writer is not None:
+                writer.release()
+
+        if self._closing or written == 0:
+            if os.path.exists(partial):
+                os.remove(partial)
+            if not self._closing:
+                self.failed += 1
+            return False
+
+        os.replace(partial, proxy)
+        self.transcoded += 1
+        return True
+
+    def shutdown(self):
+        """Abandon queued and running transcodes"""
+        with self._lock:
+            self._closing = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def get_stats(self):
+        with self._lock:
+            pending = len(self._jobs)
+        return {"enabled": self.enabled, "pending": pending,
+                "transcoded": self.transcoded, "failed": self.failed}
+
+
+proxy_cache = ProxyCache()
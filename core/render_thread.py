@@ -0,0 +1,102 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class RenderThread(threading.Thread):
+    """Renders mask snapshots on a dedicated thread, off the Qt event loop.
+
+    The GUI thread hands over the scene with submit(); the thread renders it into
+    the renderer's ring of output buffers and publishes each completed frame.
+    Readers (the projection window) only ever blit the newest published frame;
+    callbacks are called with its frame_seq on this thread as soon as it's
+    published, so they can schedule a repaint.
+    """
+
+    def __init__(self, renderer, fps=30.0):
+        super().__init__(name="render", daemon=True)
+        self.renderer = renderer
+        self.fps = fps  # Self-paced rate; 0 or None renders only on request_frame()
+
+        self._scene = []
+        self._scene_lock = threading.Lock()
+        self._frame_lock = threading.RLock()  # Held while a frame is being rendered
+        self._wake = threading.Event()
+        self._running = False
+        self.callbacks = []  # Called with frame_seq after each publish
+
+        # Stats
+        self.frames_rendered = 0
+        self.last_render_time = 0.0
+
+    def submit(self, masks):
+        """Snapshot the masks on the calling thread and make them the scene to render"""
+        snapshots = [mask.snapshot() for mask in masks]
+        with self._scene_lock:
+            self._scene = snapshots
+
+    def request_frame(self):
+        """Wake the thread to render a frame now"""
+        self._wake.set()
+
+    @contextmanager
+    def paused(self):
+        """Block rendering while the caller uses the renderer or releases media"""
+        with self._frame_lock:
+            yield self.renderer
+
+    def start(self):
+        self._running = True
+        super().start()
+
+    def stop(self):
+        """Stop rendering and wait for the thread to finish"""
+        self._running = False
+        self._wake.set()
+        if self.is_alive():
+            self.join()
+
+    def render_once(self):
+        """Render the current scene and publish it"""
+        with self._scene_lock:
+            scene = self._scene
+
+        with self._frame_lock:
+            start = time.perf_counter()
+            renderer = self.renderer
+            renderer.reset_canvas()
+            renderer.render_masks(scene)
+
+            # Draw grids if enabled
+            if renderer.show_grid:
+                for mask in scene:
+                    renderer.draw_grid(mask)
+
+            renderer.publish()
+            frame_seq = renderer.frame_seq
+            self.last_render_time = time.perf_counter() - start
+            self.frames_rendered += 1
+
+        for callback in self.callbacks:
+            callback(frame_seq)
+
+    def run(self):
+        next_frame = time.monotonic()
+        while self._running:
+            if self.fps:
+                timeout = max(0.0, next_frame - time.monotonic())
+            else:
+                timeout = None
+            self._wake.wait(timeout)
+            self._wake.clear()
+            if not self._running:
+                break
+
+            try:
+                self.render_once()
+            except Exception as e:
+                print(f"Render error: {e}")
+
+            if self.fps:
+                # Pace against the monotonic clock; if we fell behind, don't try to catch up
+                next_frame = max(next_frame + 1.0 / self.fps, time.monotonic())
@@ -1,139 +1,491 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 
+class BufferPool:
+    """Recycles scratch arrays by shape so steady-state rendering does not allocate"""
+
+    def __init__(self, max_idle=32):
+        self.max_idle = max_idle
+        self._idle = OrderedDict()  # (shape, dtype) -> list of free arrays
+        self._idle_count = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        key = (tuple(shape), np.dtype(dtype).str)
+        free = self._idle.get(key)
+        if free:
+            self._idle_count -= 1
+            buffer = free.pop()
+            if not free:
+                del self._idle[key]
+            return buffer
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, buffer):
+        key = (buffer.shape, buffer.dtype.str)
+        self._idle.setdefault(key, []).append(buffer)
+        self._idle.move_to_end(key)
+        self._idle_count += 1
+
+        # Drop the least recently used shapes (e.g. left over from a drag)
+        while self._idle_count > self.max_idle:
+            oldest_key, oldest = next(iter(self._idle.items()))
+            oldest.pop(0)
+            self._idle_count -= 1
+            if not oldest:
+                del self._idle[oldest_key]
+
+    def clear(self):
+        self._idle.clear()
+        self._idle_count = 0
+
+class MaskGeometry:
+    """Warp matrix and coverage raster of a mask, valid while its version key is unchanged"""
+
+    def __init__(self):
+        self.key = None
+        self.roi = None
+        self.matrix = None
+        self.is_affine = False
+        self.coverage = None
+        # Pixels inside the mask but outside the rotated/scaled media frame
+        self.holes = None
+        # Output pixels per native media pixel, at most 1 (see get_media_footprint)
+        self.media_scale = 1.0
+        # Native media rectangle (x0, y0, x1, y1) the mask samples (see get_source_rect)
+        self.source_rect = None
+
+class RenderJob:
+    """Per-frame work item for one mask: source frame, cached geometry and scratch buffers"""
+
+    def __init__(self, frame, geometry, matrix=None):
+        self.frame = frame
+        self.geometry = geometry
+        # Warp matrix for this frame's size; differs from geometry.matrix for downscaled frames
+        self.matrix = geometry.matrix if matrix is None else matrix
+        self.warped = None  # Warped media, in the source's channel layout
+        self.pixels = None  # Warped media converted to the canvas' BGRX layout
+
+# cvtColor codes that expand a frame with the given channel count to BGRX
+_TO_BGRX = {
+    1: cv2.COLOR_GRAY2BGRA,
+    3: cv2.COLOR_BGR2BGRA,
+}
+
+# Opaque black as a native-endian 32-bit pixel, for clearing BGRX buffers in one fill
+_BGRX_BLACK = np.array([0, 0, 0, 255], dtype=np.uint8).view(np.uint32)[0]
+
 class Renderer:
-    def __init__(self, width, height):
+    """Renders masks into BGRX output buffers.
+
+    The 4-byte BGRX layout is what QImage.Format_RGB32 uses on little-endian
+    machines, so published frames can back a QImage without any conversion.
+    """
+
+    def __init__(self, width, height, render_threads=1, buffer_count=2):
+        # Projection space, in which mask vertices are defined
         self.width = width
         self.height = height
-        self.output_canvas = None
+        # Output buffer size; masks are scaled into it through their homography
+        self._output_size = None  # None follows the projection size
+        self.output_width = width
+        self.output_height = height
         self.show_grid = False
+        # Wait for decoders instead of repeating the last frame (used by export)
+        self.block_on_decode = False
+
+        # Ring of output buffers: masks are drawn into the back buffer,
+        # readers only ever see the last published (front) one. Readers on
+        # other threads pin the front buffer so it is not reused under them.
+        self._buffers = [None] * max(2, buffer_count)
+        self._pinned = [0] * len(self._buffers)
+        self._front = None
+        self._back = 0
+        self._pending_size = None
+        self.back_buffer = None
+        self.frame_seq = 0  # Incremented on every publish
+        self._publish_lock = threading.Lock()
+
+        # When enabled, masks are warped and composited only inside their
+        # bounding box instead of across the whole projection canvas
+        self.roi_rendering = True
+        # Per-mask warp matrices and coverage rasters, keyed by live mask
+        # (snapshots of the same mask share an entry)
+        self._geometry_cache = weakref.WeakKeyDictionary()
+        # Scratch buffers for per-mask warps
+        self.buffer_pool = BufferPool()
+
+        # Optional worker pool for warping masks concurrently
+        self.render_threads = 1
+        self._executor = None
+        self._cv_threads = None  # cv2 thread count to restore when going serial
+        self.set_render_threads(render_threads)
+
         self.reset_canvas()
 
+    @property
+    def output_canvas(self):
+        """Last published frame"""
+        if self._front is None:
+            return None
+        return self._buffers[self._front]
+
+    def resize(self, width, height):
+        """Change the projection size; it takes effect at the next reset_canvas"""
+        self._pending_size = (width, height)
+
+    def set_output_size(self, width, height):
+        """Render into width x height buffers (e.g. the window or export size) instead
+        of the projection size; None follows the projection size. Takes effect at the
+        next reset_canvas."""
+        self._output_size = (int(width), int(height)) if width and height else None
+
+    @property
+    def output_scale(self):
+        return self.output_width / self.width, self.output_height / self.height
+
+    def to_output(self, points):
+        """Map points from projection space to output pixel space"""
+        sx, sy = self.output_scale
+        return points * np.array([sx, sy], dtype=np.float32)
+
+    def _next_back_index(self):
+        count = len(self._buffers)
+        for step in range(1, count + 1):
+            index = (self._back + step) % count
+            if index != self._front and not self._pinned[index]:
+                return index
+        # Every other buffer is pinned; reuse the oldest non-front one
+        return (self._front + 1) % count
+
     def reset_canvas(self):
-        self.output_canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        """Pick the back buffer and clear it in place, reallocating only when the size changed"""
+        if self._pending_size is not None:
+            self.width, self.height = self._pending_size
+            self._pending_size = None
+        self.output_width, self.output_height = self._output_size or (self.width, self.height)
 
-    def render_mask(self, mask):
-        if mask.media is None:
-            return
+        with self._publish_lock:
+            self._back = self._next_back_index()
+        shape = (self.output_height, self.output_width, 4)
+        buffer = self._buffers[self._back]
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+            self._buffers[self._back] = buffer
+        buffer.view(np.uint32).fill(_BGRX_BLACK)
+        self.back_buffer = buffer
+
+    def publish(self):
+        """Make the back buffer the new front buffer"""
+        with self._publish_lock:
+            self._front = self._back
+            self.frame_seq += 1
+
+    def get_mask_roi(self, mask):
+        """Return the (x0, y0, x1, y1) output rectangle touched by a mask, or None if off-canvas"""
+        if not self.roi_rendering:
+            return 0, 0, self.output_width, self.output_height
+
+        vertices = self.to_output(mask.vertices)
+        min_x, min_y = np.min(vertices, axis=0)
+        max_x, max_y = np.max(vertices, axis=0)
+        x0 = max(0, int(np.floor(min_x)))
+        y0 = max(0, int(np.floor(min_y)))
+        x1 = min(self.output_width, int(np.ceil(max_x)) + 1)
+        y1 = min(self.output_height, int(np.ceil(max_y)) + 1)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, y0, x1, y1
+
+    @staticmethod
+    def get_media_footprint(matrix, media_w, media_h):
+        """Output pixels per media pixel along the media frame's longest projected edges, capped at 1"""
+        corners = np.array([[[0, 0], [media_w, 0], [media_w, media_h], [0, media_h]]], dtype=np.float64)
+        quad = cv2.perspectiveTransform(corners, matrix)[0]
+        edges = np.linalg.norm(quad - np.roll(quad, -1, axis=0), axis=1)
+        scale = max(max(edges[0], edges[2]) / media_w, max(edges[1], edges[3]) / media_h)
+        return min(1.0, float(scale))
+
+    @staticmethod
+    def get_source_rect(matrix, polygon, media_w, media_h, margin=4):
+        """Native media rectangle that a warp by matrix samples inside polygon (ROI space).
+
+        Padded by margin pixels for interpolation and rasterization, and
+        clipped to the media frame (at least one pixel remains).
+        """
+        points = np.hstack([polygon, np.ones((len(polygon), 1))]) @ np.linalg.inv(matrix).T
+        if np.any(points[:, 2] <= 1e-9):
+            # Part of the mask maps from beyond the horizon; sample everything
+            return 0.0, 0.0, float(media_w), float(media_h)
+        points = points[:, :2] / points[:, 2:]
+        x0, y0 = np.min(points, axis=0) - margin
+        x1, y1 = np.max(points, axis=0) + margin
+        x0 = min(max(0.0, float(x0)), media_w - 1.0)
+        y0 = min(max(0.0, float(y0)), media_h - 1.0)
+        return x0, y0, max(x0 + 1.0, min(float(media_w), float(x1))), max(y0 + 1.0, min(float(media_h), float(y1)))
+
+    def _get_geometry(self, mask, media_w, media_h):
+        """Return the cached warp matrix and coverage raster of a mask, rebuilding them when it changed"""
+        key = (mask.version, mask.media_transform.version, media_w, media_h,
+               self.width, self.height, self.output_width, self.output_height,
+               self.roi_rendering)
+        geometry = self._geometry_cache.get(mask.source)
+        if geometry is None or geometry.key != key:
+            geometry = self._build_geometry(mask, media_w, media_h)
+            geometry.key = key
+            self._geometry_cache[mask.source] = geometry
+        return geometry
+
+    def _build_geometry(self, mask, media_w, media_h):
+        geometry = MaskGeometry()
+        geometry.roi = self.get_mask_roi(mask)
+        if geometry.roi is None:
+            return geometry
+
+        transform = mask.media_transform
+        vertices = mask.vertices[:3] if len(mask.vertices) == 3 else mask.vertices[:4]
+        vertices = self.to_output(vertices)
+
+        # Shift the mask warp into ROI space
+        x0, y0, x1, y1 = geometry.roi
+        roi_shift = np.array([
+            [1, 0, -x0],
+            [0, 1, -y0],
+            [0, 0, 1]
+        ], dtype=np.float64)
+
+        # Rotation, scale, offset and mask warp in a single resampling matrix
+        geometry.matrix = roi_shift @ transform.compile(media_w, media_h, vertices)
+        geometry.media_scale = self.get_media_footprint(geometry.matrix, media_w, media_h)
+        polygon = self.to_output(mask.vertices) - (x0, y0)
+        geometry.source_rect = self.get_source_rect(geometry.matrix, polygon, media_w, media_h)
+        geometry.is_affine = len(vertices) == 3
+        if geometry.is_affine:
+            geometry.matrix = geometry.matrix[:2]
+
+        # Rasterize the mask polygon once, in ROI space
+        roi_shape = (y1 - y0, x1 - x0)
+        geometry.coverage = np.zeros(roi_shape, dtype=np.uint8)
+        cv2.fillPoly(geometry.coverage, [(vertices - (x0, y0)).astype(np.int32)], 255)
+
+        if transform.crops_media():
+            # Rotated/scaled media used to be cropped back to its original
+            # frame after each step; keep whatever falls outside black
+            mask_matrix = roi_shift @ transform.get_mask_matrix(media_w, media_h, vertices)
+            frame_matrices = [mask_matrix]
+            if transform.rotation != 0:
+                frame_matrices.append(mask_matrix @ transform.get_scale_matrix(media_w, media_h))
+
+            frame_corners = np.array([[
+                [0, 0],
+                [media_w, 0],
+                [media_w, media_h],
+                [0, media_h]
+            ]], dtype=np.float64)
+            inside = geometry.coverage.copy()
+            for frame_matrix in frame_matrices:
+                frame_quad = cv2.perspectiveTransform(frame_corners, frame_matrix)[0]
+                frame_img = np.zeros(roi_shape, dtype=np.uint8)
+                cv2.fillPoly(frame_img, [frame_quad.astype(np.int32)], 255)
+                inside = cv2.bitwise_and(inside, frame_img)
+
+            holes = cv2.bitwise_and(geometry.coverage, cv2.bitwise_not(inside))
+            if cv2.countNonZero(holes):
+                geometry.holes = holes
+
+        return geometry
+
+    def _prepare_mask(self, mask, now=None):
+        """Fetch the frame and geometry of a mask; returns a RenderJob or None"""
+        media = mask.media
+        if media is None or len(mask.vertices) < 3:
+            return None
+        if not media.ready and media.poster is None:
+            # Still opening, and never probed, so there's nothing to show yet
+            return None
 
-        frame = mask.media.get_current_frame()
+        # Geometry is in native media pixels, whatever size the frames arrive at
+        media_w, media_h = media.width, media.height
+        try:
+            geometry = self._get_geometry(mask, media_w, media_h)
+        except cv2.error:
+            return None
+        if geometry.roi is None:
+            return None
+
+        # Tell the media how much resolution this mask needs before fetching,
+        # so it can decode at a working size instead of full resolution
+        media.set_footprint(geometry.media_scale)
+
+        if media.is_tiled:
+            # Huge stills: read only the tiles this mask samples
+            frame, (rx0, ry0, rx1, ry1) = media.get_region(geometry.source_rect)
+        else:
+            frame = media.get_current_frame(now=now, block=self.block_on_decode)
+            rx0, ry0, rx1, ry1 = 0, 0, media_w, media_h
         if frame is None:
+            return None
+
+        matrix = None
+        frame_h, frame_w = frame.shape[:2]
+        if (frame_w, frame_h) != (rx1 - rx0, ry1 - ry0) or rx0 or ry0:
+            # Prepend the frame -> native mapping: the working size scale (pixel-center
+            # aligned, like cv2.resize) and, for regions, their offset
+            sx, sy = (rx1 - rx0) / frame_w, (ry1 - ry0) / frame_h
+            ingest_scale = np.array([
+                [sx, 0, rx0 + 0.5 * sx - 0.5],
+                [0, sy, ry0 + 0.5 * sy - 0.5],
+                [0, 0, 1]
+            ], dtype=np.float64)
+            matrix = geometry.matrix @ ingest_scale
+
+        x0, y0, x1, y1 = geometry.roi
+        roi_shape = (y1 - y0, x1 - x0)
+        job = RenderJob(frame, geometry, matrix)
+        job.warped = self.buffer_pool.acquire(roi_shape + frame.shape[2:], frame.dtype)
+        job.pixels = self.buffer_pool.acquire(roi_shape + (4,), np.uint8)
+        return job
+
+    def _release_job(self, job):
+        self.buffer_pool.release(job.warped)
+        self.buffer_pool.release(job.pixels)
+
+    @staticmethod
+    def _warp_job(job):
+        """Resample the source frame exactly once, straight into ROI space"""
+        frame, geometry, warped = job.frame, job.geometry, job.warped
+        x0, y0, x1, y1 = geometry.roi
+        roi_size = (x1 - x0, y1 - y0)
+        if geometry.is_affine:
+            cv2.warpAffine(frame, job.matrix, roi_size, dst=warped,
+                           flags=cv2.INTER_LINEAR,
+                           borderMode=cv2.BORDER_CONSTANT,
+                           borderValue=(0, 0, 0))
+        else:
+            cv2.warpPerspective(frame, job.matrix, roi_size, dst=warped,
+                                flags=cv2.INTER_LINEAR,
+                                borderMode=cv2.BORDER_CONSTANT,
+                                borderValue=(0, 0, 0))
+
+        if geometry.holes is not None:
+            cv2.subtract(warped, warped, dst=warped, mask=geometry.holes)
+
+        # Expand to the canvas' BGRX layout (opaque alpha)
+        conversion = _TO_BGRX.get(warped.shape[2] if warped.ndim == 3 else 1)
+        if conversion is None:
+            np.copyto(job.pixels, warped)
+        else:
+            cv2.cvtColor(warped, conversion, dst=job.pixels)
+
+    def _composite_job(self, job):
+        """Composite a warped mask in place, inside the mask polygon only"""
+        x0, y0, x1, y1 = job.geometry.roi
+        canvas_roi = self.back_buffer[y0:y1, x0:x1]
+        cv2.copyTo(job.pixels, job.geometry.coverage, canvas_roi)
+
+    def render_mask(self, mask, now=None):
+        """Render one mask; now is the media playback time (None follows the media clock)"""
+        job = self._prepare_mask(mask, now)
+        if job is None:
             return
+        try:
+            self._warp_job(job)
+            self._composite_job(job)
+        finally:
+            self._release_job(job)
 
-        media_h, media_w = frame.shape[:2]
-        transform = mask.media_transform
+    def render_masks(self, masks, now=None):
+        """Render masks in list order, warping them concurrently when render threads are enabled"""
+        if self._executor is None:
+            for mask in masks:
+                self.render_mask(mask, now)
+            return
 
-        # Create transformed media canvas
-        transformed_media = frame.copy()
-
-        # Apply rotation
-        if transform.rotation != 0:
-            center = (media_w / 2, media_h / 2)
-            rotation_matrix = cv2.getRotationMatrix2D(center, transform.rotation, 1.0)
-            transformed_media = cv2.warpAffine(transformed_media, rotation_matrix, (media_w, media_h))
-
-        # Apply scale
-        if transform.scale != 1.0:
-            new_w = int(media_w * transform.scale)
-            new_h = int(media_h * transform.scale)
-            transformed_media = cv2.resize(transformed_media, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
-
-            # Adjust to keep centered
-            if new_w < media_w or new_h < media_h:
-                # Pad
-                pad_w = max(0, (media_w - new_w) // 2)
-                pad_h = max(0, (media_h - new_h) // 2)
-                transformed_media = cv2.copyMakeBorder(transformed_media, pad_h, media_h - new_h - pad_h,
-                                                       pad_w, media_w - new_w - pad_w,
-                                                       cv2.BORDER_CONSTANT, value=(0, 0, 0))
-            else:
-                # Crop
-                crop_w = (new_w - media_w) // 2
-                crop_h = (new_h - media_h) // 2
-                transformed_media = transformed_media[crop_h:crop_h + media_h, crop_w:crop_w + media_w]
-
-        # Apply offset by translating the source points
-        media_points = np.array([
-            [0, 0],
-            [media_w, 0],
-            [media_w, media_h],
-            [0, media_h]
-        ], dtype=np.float32)
-
-        # Offset the media within the mask space
-        offset_scale = 0.5  # Scale offset relative to mask size
-        media_points[:, 0] -= transform.offset_x * offset_scale
-        media_points[:, 1] -= transform.offset_y * offset_scale
-
-        # Perspective transform from media to mask vertices
+        # Frames are fetched and geometry is cached on the calling thread;
+        # only the warps, which release the GIL, run on the pool
+        jobs = [self._prepare_mask(mask, now) for mask in masks]
+        jobs = [job for job in jobs if job is not None]
+        self.buffer_pool.max_idle = max(self.buffer_pool.max_idle, 2 * len(jobs))
         try:
-            if len(mask.vertices) == 3:
-                # For triangles, use affine transform with 3 points
-                # Map media triangle to mask triangle
-                media_triangle = np.array([
-                    [0, 0],
-                    [media_w, 0],
-                    [media_w / 2, media_h]
-                ], dtype=np.float32)
-
-                # Apply offset to source triangle
-                media_triangle[:, 0] -= transform.offset_x * offset_scale
-                media_triangle[:, 1] -= transform.offset_y * offset_scale
-
-                dest_points = mask.vertices.astype(np.float32)
-
-                # Get affine transform for triangles
-                M = cv2.getAffineTransform(media_triangle, dest_points)
-                warped = cv2.warpAffine(transformed_media, M, (self.width, self.height),
-                                       flags=cv2.INTER_LINEAR,
-                                       borderMode=cv2.BORDER_CONSTANT,
-                                       borderValue=(0, 0, 0))
-
-                # Create mask for blending
-                mask_img = np.zeros((self.height, self.width), dtype=np.uint8)
-                cv2.fillPoly(mask_img, [dest_points.astype(np.int32)], 255)
-
-                # Blend with output canvas
-                mask_3ch = cv2.cvtColor(mask_img, cv2.COLOR_GRAY2BGR)
-                self.output_canvas = np.where(mask_3ch > 0, warped, self.output_canvas)
-
-            elif len(mask.vertices) >= 4:
-                # For rectangles/quads, use perspective transform with 4 points
-                dest_points = mask.vertices[:4].astype(np.float32)
-
-                # Get homography
-                H = cv2.getPerspectiveTransform(media_points, dest_points)
-                warped = cv2.warpPerspective(transformed_media, H, (self.width, self.height),
-                                            flags=cv2.INTER_LINEAR,
-                                            borderMode=cv2.BORDER_CONSTANT,
-                                            borderValue=(0, 0, 0))
-
-                # Create mask for blending
-                mask_img = np.zeros((self.height, self.width), dtype=np.uint8)
-                cv2.fillPoly(mask_img, [dest_points.astype(np.int32)], 255)
-
-                # Blend with output canvas
-                mask_3ch = cv2.cvtColor(mask_img, cv2.COLOR_GRAY2BGR)
-                self.output_canvas = np.where(mask_3ch > 0, warped, self.output_canvas)
-        except:
-            pass
+            for _ in self._executor.map(self._warp_job, jobs):
+                pass
+            # Composite serially in z-order so output matches the serial path
+            for job in jobs:
+                self._composite_job(job)
+        finally:
+            for job in jobs:
+                self._release_job(job)
+
+    def set_render_threads(self, count):
+        """Set how many worker threads warp masks; 1 renders serially"""
+        count = max(1, int(count))
+        if count == self.render_threads:
+            return
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        if count > 1:
+            if self._cv_threads is None:
+                self._cv_threads = cv2.getNumThreads()
+            # Split the cores between our workers and OpenCV's own parallel
+            # loops instead of letting every warp spawn a full set of threads
+            cv2.setNumThreads(max(1, (os.cpu_count() or 1) // count))
+            self._executor = ThreadPoolExecutor(max_workers=count, thread_name_prefix="mask-render")
+        elif self._cv_threads is not None:
+            cv2.setNumThreads(self._cv_threads)
+            self._cv_threads = None
+
+        self.render_threads = count
+
+    def shutdown(self):
+        """Stop the render worker threads"""
+        self.set_render_threads(1)
 
     def get_output(self):
         return self.output_canvas
 
+    def get_frame(self):
+        """Return (frame_seq, frame) for the last published frame"""
+        with self._publish_lock:
+            return self.frame_seq, self.output_canvas
+
+    def acquire_frame(self):
+        """Like get_frame, but pins the buffer until release_frame so it is not reused"""
+        with self._publish_lock:
+            if self._front is None:
+                return self.frame_seq, None
+            self._pinned[self._front] += 1
+            return self.frame_seq, self._buffers[self._front]
+
+    def release_frame(self, frame):
+        """Unpin a buffer returned by acquire_frame"""
+        if frame is None:
+            return
+        with self._publish_lock:
+            for index, buffer in enumerate(self._buffers):
+                if buffer is frame:
+                    self._pinned[index] = max(0, self._pinned[index] - 1)
+                    break
+
     def draw_grid(self, mask):
         """Draw grid around mask boundaries"""
         if not self.show_grid:
             return
 
-        vertices = mask.vertices.astype(np.int32)
+        vertices = self.to_output(mask.vertices).astype(np.int32)
 
         # Draw polygon outline
-        cv2.polylines(self.output_canvas, [vertices], True, (0, 255, 0), 2)
+        cv2.polylines(self.back_buffer, [vertices], True, (0, 255, 0, 255), 2)
 
         # Draw vertices as circles
         for vertex in vertices:
-            cv2.circle(self.output_canvas, tuple(vertex), 5, (0, 255, 0), -1)
+            cv2.circle(self.back_buffer, tuple(vertex), 5, (0, 255, 0, 255), -1)
 
     def toggle_grid(self):
         """Toggle grid visibility"""
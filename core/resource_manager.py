@@ -0,0 +1,100 @@
+import time
+from collections import OrderedDict
+from core.media import PendingMedia
+
+
+class MediaResourceManager:
+    """Keeps the media of recently used projects open and suspends the rest.
+
+    Suspending a project swaps each mask's media for a PendingMedia
+    placeholder and releases it, closing its decoders and frame buffers
+    unless another open project shares them. Switching back to a suspended
+    project reopens its media in the background through the media loader.
+    """
+
+    def __init__(self, media_loader, release_media, max_warm_projects=2):
+        self.media_loader = media_loader
+        self.release_media = release_media  # Releases a media without racing the render thread
+        self.max_warm_projects = max_warm_projects  # Inactive projects kept open
+
+        self._projects = OrderedDict()  # Project path -> masks list, least recently active first
+        self._suspended = set()
+        self.active = None
+
+        # Stats
+        self.suspends = 0
+        self.resumes = 0
+        self.evictions = 0  # Suspends forced by the warm project budget
+        self.media_suspended = 0
+        self.media_resumed = 0
+        self.last_suspend_time = 0.0  # Seconds spent releasing media on the last suspend
+
+    def activate(self, project, masks):
+        """Make project the active one, resuming its media and enforcing the budget"""
+        if project is not None:
+            self._projects[project] = masks
+            self._projects.move_to_end(project)
+            if project in self._suspended:
+                self.resume(project)
+        self.active = project
+        self._enforce_budget()
+
+    def forget(self, project):
+        """Stop tracking a project whose masks were released elsewhere"""
+        self._projects.pop(project, None)
+        self._suspended.discard(project)
+
+    def set_max_warm_projects(self, count):
+        self.max_warm_projects = max(0, count)
+        self._enforce_budget()
+
+    def is_suspended(self, project):
+        return project in self._suspended
+
+    def _enforce_budget(self):
+        warm = [project for project in self._projects
+                if project != self.active and project not in self._suspended]
+        while len(warm) > self.max_warm_projects:
+            self.suspend(warm.pop(0))
+            self.evictions += 1
+
+    def suspend(self, project):
+        """Release every media of an inactive project, keeping what's needed to reopen it"""
+        if project == self.active or project in self._suspended or project not in self._projects:
+            return
+        start = time.perf_counter()
+        for mask in self._projects[project]:
+            media = mask.media
+            if media is None:
+                continue
+            mask.media = PendingMedia.from_media(media)
+            self.release_media(media)
+            self.media_suspended += 1
+        self._suspended.add(project)
+        self.suspends += 1
+        self.last_suspend_time = time.perf_counter() - start
+
+    def resume(self, project):
+        """Reopen a suspended project's media in the background"""
+        if project not in self._suspended:
+            return
+        self._suspended.discard(project)
+        for mask in self._projects[project]:
+            if isinstance(mask.media, PendingMedia) and not mask.media.released:
+                self.media_loader.load(mask, mask.media)
+                self.media_resumed += 1
+        self.resumes += 1
+
+    def get_stats(self):
+        return {
+            "projects": len(self._projects),
+            "warm": len(self._projects) - len(self._suspended),
+            "suspended": len(self._suspended),
+            "max_warm_projects": self.max_warm_projects,
+            "suspends": self.suspends,
+            "resumes": self.resumes,
+            "evictions": self.evictions,
+            "media_suspended": self.media_suspended,
+            "media_resumed": self.media_resumed,
+            "last_suspend_ms": self.last_suspend_time * 1000,
+        }
@@ -0,0 +1,100 @@
+import time
+from PyQt5.QtCore import QObject, QTimer, Qt
+
+
+class FrameScheduler(QObject):
+    """Single frame clock that drives rendering and repaints.
+
+    Ticks are paced against time.monotonic() deadlines rather than a fixed
+    timer interval, so they don't drift. Subscribers run on every Nth tick,
+    which lets cheap-to-skip work (e.g. the editor) run at a lower rate.
+    """
+
+    def __init__(self, fps=30.0, parent=None):
+        super().__init__(parent)
+        self.fps = fps
+        # A tick later than this fraction of the frame interval counts as late
+        self.late_tolerance = 0.25
+
+        self._subscribers = []  # (callback, divisor)
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._tick)
+        self._next_deadline = None
+
+        # Stats
+        self.frame_index = 0
+        self.dropped_frames = 0  # Deadlines skipped entirely because we fell behind
+        self.late_frames = 0  # Ticks that ran, but later than late_tolerance
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps
+
+    def subscribe(self, callback, divisor=1):
+        """Call callback(frame_index) on every divisor-th frame"""
+        self._subscribers.append((callback, max(1, int(divisor))))
+
+    def set_divisor(self, callback, divisor):
+        """Run an existing subscriber on every divisor-th frame from now on"""
+        divisor = max(1, int(divisor))
+        self._subscribers = [(cb, divisor if cb == callback else div) for cb, div in self._subscribers]
+
+    def unsubscribe(self, callback):
+        self._subscribers = [(cb, div) for cb, div in self._subscribers if cb != callback]
+
+    def set_fps(self, fps):
+        self.fps = fps
+        if self.is_running():
+            self._next_deadline = time.monotonic()
+
+    def is_running(self):
+        return self._next_deadline is not None
+
+    def start(self):
+        self._next_deadline = time.monotonic()
+        self._timer.start(0)
+
+    def stop(self):
+        self._timer.stop()
+        self._next_deadline = None
+
+    def reset_stats(self):
+        self.dropped_frames = 0
+        self.late_frames = 0
+
+    def _tick(self):
+        if self._next_deadline is None:
+            return
+
+        interval = self.interval
+        lateness = time.monotonic() - self._next_deadline
+        if lateness >= interval:
+            # Whole frames were missed: skip them instead of bursting to catch up
+            missed = int(lateness // interval)
+            self.dropped_frames += missed
+            self.frame_index += missed
+            self._next_deadline += missed * interval
+        elif lateness > interval * self.late_tolerance:
+            self.late_frames += 1
+
+        for callback, divisor in list(self._subscribers):
+            if self.frame_index % divisor == 0:
+                try:
+                    callback(self.frame_index)
+                except Exception as e:
+                    print(f"Frame callback error: {e}")
+
+        self.frame_index += 1
+        self._next_deadline += interval
+        delay = max(0.0, self._next_deadline - time.monotonic())
+        self._timer.start(int(round(delay * 1000)))
+
+    def get_stats(self):
+        return {
+            "fps": self.fps,
+            "frame_index": self.frame_index,
+            "dropped_frames": self.dropped_frames,
+            "late_frames": self.late_frames,
+        }
@@ -0,0 +1,172 @@
+import bisect
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+SEQUENCE_FRAME_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.exr', '.webp')
+ANIMATION_EXTENSIONS = ('.gif',)
+
+
+def is_sequence_path(path):
+    """True for paths played as an ImageSequence: frame folders and animated images"""
+    return os.path.isdir(path) or path.lower().endswith(ANIMATION_EXTENSIONS)
+
+
+def exr_enabled():
+    """Whether OpenCV may decode EXR frames in this process (see --enable-exr in main.py)"""
+    return os.environ.get("OPENCV_IO_ENABLE_OPENEXR", "").lower() in ("1", "true", "on", "yes")
+
+
+def _natural_key(name):
+    # frame_2.png sorts before frame_10.png, padded or not
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+def to_8bit(frame):
+    """BGR uint8 copy of a decoded frame (16-bit or float/EXR frames are scaled down)"""
+    if frame.dtype == np.uint8:
+        result = frame
+    elif frame.dtype == np.uint16:
+        result = (frame >> 8).astype(np.uint8)
+    else:
+        # Float frames (EXR) are taken as 0..1, without tone mapping
+        result = (np.clip(frame, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+    if result.ndim == 2:
+        return cv2.cvtColor(result, cv2.COLOR_GRAY2BGR)
+    if result.shape[2] == 4:
+        return cv2.cvtColor(result, cv2.COLOR_BGRA2BGR)
+    return result
+
+
+class ImageSequence:
+    """Frames of a folder of numbered images, or of an animated image (GIF).
+
+    Folder frames are decoded one file at a time, on demand. Animated
+    images are decoded whole when opened, since each of their frames
+    builds on the previous one, and keep their own frame timing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = None  # Folder frames, in playback order
+        self.frames = None  # Animation frames, decoded
+        self.frame_starts = None  # Animation frame start times (seconds), when it has them
+        self.duration = None  # Animation length (seconds), when it has frame timing
+        self.fps = None  # Native rate, when the animation only has an average one
+
+        if os.path.isdir(path):
+            extensions = SEQUENCE_FRAME_EXTENSIONS if exr_enabled() else \
+                tuple(ext for ext in SEQUENCE_FRAME_EXTENSIONS if ext != '.exr')
+            names = [name for name in os.listdir(path) if name.lower().endswith(extensions)]
+            if not names:
+                if any(name.lower().endswith('.exr') for name in os.listdir(path)):
+                    raise ValueError(f"EXR frames in {path} need EXR support; start BadMapper with --enable-exr")
+                raise ValueError(f"No image frames in {path}")
+            self.files = [os.path.join(path, name) for name in sorted(names, key=_natural_key)]
+        else:
+            self._read_animation(path)
+        self.frame_count = len(self.files or self.frames)
+
+    def _read_animation(self, path):
+        if hasattr(cv2, "imreadanimation"):
+            # OpenCV 4.11+: frames with their individual delays
+            ok, animation = cv2.imreadanimation(path)
+            if ok and len(animation.frames):
+                self.frames = [to_8bit(frame) for frame in animation.frames]
+                delays = [max(0.01, delay / 1000.0) for delay in animation.durations]
+                self.frame_starts = list(np.cumsum([0.0] + delays[:-1]))
+                self.duration = float(sum(delays))
+                return
+
+        # Older OpenCV: decode through the video backend at its average rate
+        cap = cv2.VideoCapture(path)
+        frames = []
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+            self.fps = cap.get(cv2.CAP_PROP_FPS) or None
+        finally:
+            cap.release()
+        if not frames:
+            raise ValueError(f"Failed to read animation {path}")
+        self.frames = frames
+
+    @property
+    def in_memory(self):
+        return self.frames is not None
+
+    def read(self, index):
+        """Frame at file index (0 <= index < frame_count), or None if it can't be decoded"""
+        if self.frames is not None:
+            return self.frames[index]
+        frame = cv2.imread(self.files[index], cv2.IMREAD_ANYDEPTH | cv2.IMREAD_COLOR)
+        return to_8bit(frame) if frame is not None else None
+
+    def get_index(self, media_time, fps):
+        """Unwrapped playback index at media_time seconds; loops continue counting up"""
+        if self.frame_starts is None:
+            # Small epsilon so e.g. frame 3 of a 30 fps export lands on frame 3, not 2.9999
+            return int(media_time * fps + 1e-6)
+        loop, offset = divmod(media_time + 1e-6, self.duration)
+        return int(loop) * self.frame_count + bisect.bisect_right(self.frame_starts, offset) - 1
+
+    def get_duration(self, fps):
+        """Length of one loop in seconds at fps (ignored for timed animations)"""
+        if self.duration is not None:
+            return self.duration
+        return self.frame_count / fps if fps else 0.0
+
+
+class SequenceDecoder:
+    """Decodes the frames after the playhead on a pool of worker threads.
+
+    Keeps at most depth frames in flight or decoded, all at or after the
+    last requested index; frames behind the playhead are dropped and
+    pending ones cancelled, so skipping ahead or jumping back just moves
+    the window.
+    """
+
+    def __init__(self, sequence, depth=8, workers=None, ingest=None):
+        self.sequence = sequence
+        self.depth = max(1, depth)
+        self.ingest = ingest  # Applied to each frame on the worker (e.g. downscaling)
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sequence-decode")
+        self.frames = {}  # Unwrapped index -> Future of the decoded frame
+
+        # Stats
+        self.frames_decoded = 0
+        self.failures = 0
+
+    def _decode(self, index):
+        frame = self.sequence.read(index % self.sequence.frame_count)
+        if frame is None:
+            self.failures += 1
+            print(f"Warning: Could not read frame {index % self.sequence.frame_count} of {self.sequence.path}")
+            return None
+        self.frames_decoded += 1
+        return self.ingest(frame) if self.ingest else frame
+
+    def take(self, index, block=False):
+        """Decoded frame at unwrapped index, or None if it isn't ready (or failed)"""
+        for stale in [i for i in self.frames if i < index or i >= index + self.depth]:
+            self.frames.pop(stale).cancel()
+        for ahead in range(index, index + self.depth):
+            if ahead not in self.frames:
+                self.frames[ahead] = self._executor.submit(self._decode, ahead)
+
+        future = self.frames[index]
+        if not block and not future.done():
+            return None
+        return future.result()
+
+    def release(self):
+        for future in self.frames.values():
+            future.cancel()
+        self.frames.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
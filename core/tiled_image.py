@@ -0,0 +1,165 @@
+import json
+import os
+import shutil
+import cv2
+import numpy as np
+from core.content_key import content_keys
+
+
+class TiledImage:
+    """Huge still image stored as square tiles in memory-mapped files.
+
+    The image and its halved levels are each kept in a .npy file of shape
+    (tile rows, tile columns, tile_size, tile_size, channels), so reading a
+    region only touches the tiles it overlaps. Tile sets live under
+    directory/<content key>/ and are built once from a full decode;
+    opening an existing set decodes nothing.
+    """
+
+    tile_size = 512
+    directory = os.path.join(os.path.expanduser("~"), ".cache", "badmapper", "tiles")
+    max_disk_bytes = 16 * 1024 * 1024 * 1024  # Least recently opened sets are deleted past this
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.path = path
+        self.width, self.height = meta["width"], meta["height"]
+        self.tile_size = meta["tile_size"]
+        self.level_sizes = [tuple(size) for size in meta["levels"]]  # (w, h) per level, native first
+        self.levels = [np.load(os.path.join(path, f"L{index}.npy"), mmap_mode="r")
+                       for index in range(len(self.level_sizes))]
+
+        # Stats
+        self.tiles_read = 0
+
+    @classmethod
+    def get_set_path(cls, path):
+        return os.path.join(cls.directory, content_keys.get(path))
+
+    @classmethod
+    def open(cls, path):
+        """Tiled image of the file at path if its tile set exists, else None"""
+        try:
+            set_path = cls.get_set_path(path)
+            if not os.path.exists(os.path.join(set_path, "meta.json")):
+                return None
+            os.utime(os.path.join(set_path, "meta.json"))  # Recently used sets survive trimming
+            return cls(set_path)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not open tiles of {path}: {e}")
+            return None
+
+    @classmethod
+    def build(cls, path, image):
+        """Write the tile set of path from its full decode and open it"""
+        set_path = cls.get_set_path(path)
+        partial = set_path + ".partial"
+        shutil.rmtree(partial, ignore_errors=True)
+        os.makedirs(partial)
+        try:
+            sizes = []
+            level = image
+            while True:
+                h, w = level.shape[:2]
+                sizes.append((w, h))
+                cls._write_level(os.path.join(partial, f"L{len(sizes) - 1}.npy"), level)
+                next_w, next_h = (w + 1) // 2, (h + 1) // 2
+                if max(w, h) <= cls.tile_size or min(next_w, next_h) < 16:
+                    break
+                # Same halving as MediaSource's still pyramid, keeping pixel-center alignment
+                level = cv2.resize(level, (next_w, next_h), interpolation=cv2.INTER_AREA)
+
+            with open(os.path.join(partial, "meta.json"), "w") as f:
+                json.dump({"width": image.shape[1], "height": image.shape[0],
+                           "tile_size": cls.tile_size, "levels": sizes}, f)
+            shutil.rmtree(set_path, ignore_errors=True)
+            os.replace(partial, set_path)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+        cls.trim_disk(keep=set_path)
+        return cls(set_path)
+
+    @classmethod
+    def _write_level(cls, path, level):
+        t = cls.tile_size
+        h, w = level.shape[:2]
+        channels = level.shape[2] if level.ndim == 3 else 1
+        rows, cols = -(-h // t), -(-w // t)
+        tiles = np.lib.format.open_memmap(path, mode="w+", dtype=level.dtype,
+                                          shape=(rows, cols, t, t, channels))
+        band = np.zeros((t, cols * t, channels), dtype=level.dtype)
+        for row in range(rows):
+            rows_in_band = min(t, h - row * t)
+            band[:] = 0
+            band[:rows_in_band, :w] = level[row * t:row * t + rows_in_band].reshape(rows_in_band, w, channels)
+            tiles[row] = band.reshape(t, cols, t, channels).transpose(1, 0, 2, 3)
+        tiles.flush()
+        del tiles
+
+    @classmethod
+    def trim_disk(cls, keep=None):
+        """Delete the least recently opened tile sets past max_disk_bytes"""
+        try:
+            sets = []
+            for entry in os.scandir(cls.directory):
+                meta = os.path.join(entry.path, "meta.json")
+                if not entry.is_dir() or not os.path.exists(meta):
+                    continue
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                sets.append((os.stat(meta).st_mtime, size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in sets)
+        for _, size, path in sorted(sets):
+            if total <= cls.max_disk_bytes:
+                break
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def pick_level(self, scale):
+        """Smallest level that is still at least scale times native size"""
+        index = 0
+        while index + 1 < len(self.level_sizes):
+            next_w, next_h = self.level_sizes[index + 1]
+            if next_w < scale * self.width or next_h < scale * self.height:
+                break
+            index += 1
+        return index
+
+    def read(self, level, rect):
+        """Pixels of level covering rect (native x0, y0, x1, y1).
+
+        Returns (frame, covered) where covered is the native rectangle the
+        frame spans; it contains rect, snapped outward to level pixels.
+        """
+        w, h = self.level_sizes[level]
+        sx, sy = self.width / w, self.height / h
+        x0, y0, x1, y1 = rect
+        lx0 = min(max(0, int(np.floor(x0 / sx))), w - 1)
+        ly0 = min(max(0, int(np.floor(y0 / sy))), h - 1)
+        lx1 = max(lx0 + 1, min(w, int(np.ceil(x1 / sx))))
+        ly1 = max(ly0 + 1, min(h, int(np.ceil(y1 / sy))))
+
+        t = self.tile_size
+        tr0, tr1 = ly0 // t, (ly1 - 1) // t + 1
+        tc0, tc1 = lx0 // t, (lx1 - 1) // t + 1
+        tiles = self.levels[level][tr0:tr1, tc0:tc1]
+        self.tiles_read += tiles.shape[0] * tiles.shape[1]
+        rows, cols, _, _, channels = tiles.shape
+        block = np.asarray(tiles).transpose(0, 2, 1, 3, 4).reshape(rows * t, cols * t, channels)
+        frame = np.ascontiguousarray(block[ly0 - tr0 * t:ly1 - tr0 * t, lx0 - tc0 * t:lx1 - tc0 * t])
+        return frame, (lx0 * sx, ly0 * sy, lx1 * sx, ly1 * sy)
+
+    def get_overview(self, max_side=2048):
+        """Whole image at the largest level no longer than max_side"""
+        level = len(self.level_sizes) - 1
+        while level > 0 and max(self.level_sizes[level - 1]) <= max_side:
+            level -= 1
+        frame, _ = self.read(level, (0, 0, self.width, self.height))
+        return frame
+
+    def get_stats(self):
+        return {"tiled": True, "tile_levels": len(self.levels), "tiles_read": self.tiles_read}
@@ -1,5 +1,13 @@
 import sys
 import os
+
+# OpenCV ships its OpenEXR decoder disabled because of its history of security
+# bugs with untrusted files. --enable-exr turns it on for this run (e.g. to play
+# EXR render sequences); it has to be set before OpenCV first reads an image.
+if "--enable-exr" in sys.argv:
+    sys.argv.remove("--enable-exr")
+    os.environ["OPENCV_IO_ENABLE_OPENEXR"] = "1"
+
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtGui import QIcon
 from core.app import ProjectionMapper
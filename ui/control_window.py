@@ -1,5 +1,5 @@
 from PyQt5.QtWidgets import QWidget, QHBoxLayout
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QImage, QPainter, QColor, QPen, QBrush, QFont
 import numpy as np
 from enum import Enum
@@ -83,10 +83,9 @@ class ControlWindow(QWidget):
 
         self.setLayout(main_layout)
 
-        # Update timer
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update)
-        self.timer.start(33)  # ~30 FPS
+    def update_frame(self, frame_index=None):
+        """Called by the frame scheduler"""
+        self.update()
 
     def _on_sidebar_mask_selected(self, mask):
         """Handle mask selection from sidebar"""
@@ -1,37 +1,74 @@
 from PyQt5.QtWidgets import QWidget
-from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QImage, QPainter
-import numpy as np
-import cv2
 
 class ProjectionWindow(QWidget):
     def __init__(self, renderer, width=1920, height=1080):
         super().__init__()
         self.renderer = renderer
+        self.painted_seq = None  # frame_seq of the last painted frame
+        # Render at the window's physical pixel size instead of the projection size
+        self.match_window_resolution = True
+
+        # QImages wrapping the renderer's output buffers, keyed by buffer id
+        self._images = {}
 
         self.setWindowTitle("BadMapper - Projection Output")
         self.resize(width, height)
 
-        # Update timer for video playback
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_frame)
-        self.timer.start(33)  # ~30 FPS
+    def set_match_window_resolution(self, enabled):
+        self.match_window_resolution = enabled
+        self.update_output_size()
 
-    def update_frame(self):
-        self.update()
+    def update_output_size(self):
+        """Point the renderer's output size at this window, or back at the projection size"""
+        if self.match_window_resolution:
+            ratio = self.devicePixelRatioF()
+            self.renderer.set_output_size(round(self.width() * ratio), round(self.height() * ratio))
+        else:
+            self.renderer.set_output_size(None, None)
 
-    def paintEvent(self, event):
-        output = self.renderer.get_output()
+    def resizeEvent(self, event):
+        self.update_output_size()
+        super().resizeEvent(event)
+
+    def update_frame(self, frame_seq=None):
+        """Called when the render thread publishes a frame; repaints unless it's already shown"""
+        if self.renderer.frame_seq != self.painted_seq:
+            self.update()
 
-        if output is not None:
-            # Convert BGR to RGB
-            rgb = cv2.cvtColor(output, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb.shape
-            bytes_per_line = ch * w
-            qt_image = QImage(rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
+    def _get_image(self, output):
+        """Return a persistent QImage sharing memory with an output buffer"""
+        entry = self._images.get(id(output))
+        if entry is None or entry[0] is not output:
+            h, w, ch = output.shape
+            # BGRX bytes are QImage's RGB32 layout (0xffRRGGBB on little-endian)
+            image = QImage(output.data, w, h, ch * w, QImage.Format_RGB32)
+            image.setDevicePixelRatio(self.devicePixelRatioF())
+            entry = (output, image)
+            if len(self._images) >= 8:
+                self._images.clear()  # Stale buffers from a resize
+            self._images[id(output)] = entry
+        return entry[1]
 
+    def paintEvent(self, event):
+        # Pin the newest completed frame so the render thread can't reuse it mid-paint
+        seq, output = self.renderer.acquire_frame()
+        if output is None:
+            return
+
+        try:
+            image = self._get_image(output)
             painter = QPainter(self)
-            painter.drawImage(0, 0, qt_image.scaled(self.width(), self.height()))
+            ratio = self.devicePixelRatioF()
+            if image.width() == round(self.width() * ratio) and image.height() == round(self.height() * ratio):
+                painter.drawImage(0, 0, image)
+            else:
+                # Scale while drawing instead of making a scaled copy
+                painter.drawImage(self.rect(), image)
+            painter.end()
+            self.painted_seq = seq
+        finally:
+            self.renderer.release_frame(output)
 
     def keyPressEvent(self, event):
         from PyQt5.QtCore import Qt